@@ -0,0 +1,177 @@
+import gzip
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+import pandas as pd
+
+
+ARCHIVE_PATH = Path("archive") / "me4842.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    semester TEXT NOT NULL,
+    node TEXT NOT NULL,
+    archived_at REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (semester, node)
+);
+CREATE TABLE IF NOT EXISTS roster (
+    semester TEXT NOT NULL,
+    canvas_id INTEGER,
+    student TEXT NOT NULL,
+    login TEXT,
+    section TEXT,
+    group_name TEXT
+);
+CREATE TABLE IF NOT EXISTS scores (
+    semester TEXT NOT NULL,
+    survey TEXT NOT NULL,
+    student TEXT NOT NULL,
+    section TEXT,
+    group_name TEXT,
+    score REAL,
+    points_possible REAL,
+    percent REAL
+);
+CREATE TABLE IF NOT EXISTS responses (
+    semester TEXT NOT NULL,
+    survey TEXT NOT NULL,
+    reviewer TEXT,
+    response_key TEXT,
+    reviewee TEXT,
+    section TEXT,
+    group_name TEXT,
+    response_type TEXT,
+    weight REAL,
+    question TEXT,
+    score REAL
+);
+CREATE INDEX IF NOT EXISTS roster_semester ON roster (semester, section, group_name);
+CREATE INDEX IF NOT EXISTS roster_student ON roster (student);
+CREATE INDEX IF NOT EXISTS scores_semester ON scores (semester, survey);
+CREATE INDEX IF NOT EXISTS scores_section ON scores (semester, section);
+CREATE INDEX IF NOT EXISTS scores_group ON scores (semester, group_name);
+CREATE INDEX IF NOT EXISTS scores_student ON scores (student);
+CREATE INDEX IF NOT EXISTS responses_semester ON responses (semester, survey, question);
+CREATE INDEX IF NOT EXISTS responses_section ON responses (semester, section);
+CREATE INDEX IF NOT EXISTS responses_group ON responses (semester, group_name);
+CREATE INDEX IF NOT EXISTS responses_reviewee ON responses (reviewee);
+"""
+
+#columns a statistics query may group by
+STAT_COLUMNS = ("semester", "survey", "section", "group_name")
+
+
+#LOCAL SQLITE ARCHIVE OF EVERY SEMESTER'S SURVEYS, ROSTER AND SCORES
+class SemesterArchive:
+    # Firebase nodes are cleared each semester, this keeps them plus the graded tables for cross-semester questions
+    def __init__(self, path: str | Path = ARCHIVE_PATH):
+        self.path = Path(path)
+        os.makedirs(self.path.parent, exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def archive_node(self, semester: str, node: str, data):
+        #raw Firebase node as gzipped json, archiving the same semester again replaces it
+        blob = gzip.compress(json.dumps(data).encode("utf-8"))
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?)", (semester, node, time.time(), blob))
+
+    def load_node(self, semester: str, node: str):
+        row = self.connection.execute("SELECT data FROM nodes WHERE semester = ? AND node = ?", (semester, node)).fetchone()
+        if row is None:
+            raise KeyError(f'{node} was not archived for {semester}')
+        return json.loads(gzip.decompress(row[0]))
+
+    def archive_roster(self, semester: str, roster):
+        rows = [(semester, s.id, s.name, s.login, s.section, s.group) for s in roster]
+        with self.connection:
+            self.connection.execute("DELETE FROM roster WHERE semester = ?", (semester,))
+            self.connection.executemany("INSERT INTO roster VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def archive_results(self, semester: str, tables: dict[str, pd.DataFrame], roster=None):
+        #store the export tables, responses get the reviewee's section and group so they can be filtered like scores
+        students = tables["students"]
+        responses = tables["responses"]
+        sections = dict(zip(students["student"], students["section"]))
+        groups = dict(zip(students["student"], students["group"]))
+        if roster is not None:
+            sections.update({s.name: s.section for s in roster})
+            groups.update({s.name: s.group for s in roster})
+        #group surveys review the group itself
+        groups.update({group: group for group in tables["groups"]["group"].dropna().unique()})
+
+        score_rows = students[["semester", "survey", "student", "section", "group", "score", "points_possible", "percent"]]
+        response_rows = pd.DataFrame({
+            "semester": responses["semester"],
+            "survey": responses["survey"],
+            "reviewer": responses["reviewer"],
+            "response_key": responses["response_key"],
+            "reviewee": responses["reviewee"],
+            "section": responses["reviewee"].map(sections),
+            "group_name": responses["reviewee"].map(groups),
+            "response_type": responses["response_type"],
+            "weight": responses["weight"],
+            "question": responses["question"],
+            "score": responses["score"],
+        })
+
+        with self.connection:
+            self.connection.execute("DELETE FROM scores WHERE semester = ?", (semester,))
+            self.connection.execute("DELETE FROM responses WHERE semester = ?", (semester,))
+            self.connection.executemany("INSERT INTO scores VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows_of(score_rows))
+            self.connection.executemany("INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows_of(response_rows))
+
+    def semesters(self) -> list[str]:
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT semester FROM scores ORDER BY semester")]
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        return pd.read_sql_query(sql, self.connection, params=params)
+
+    def score_stats(self, by: tuple[str, ...] = ("semester", "survey"), survey: str | None = None, semesters: list[str] | None = None) -> pd.DataFrame:
+        #count, mean, min and max percent grouped by any of semester, survey, section and group_name
+        for column in by:
+            if column not in STAT_COLUMNS:
+                raise ValueError(f'cannot group by {column}, choose from {STAT_COLUMNS}')
+        where, params = filters(survey, semesters)
+        columns = ", ".join(by)
+        return self.query(
+            f"SELECT {columns}, COUNT(*) AS students, AVG(percent) AS mean_percent, MIN(percent) AS min_percent, MAX(percent) AS max_percent "
+            f"FROM scores {where} GROUP BY {columns} ORDER BY {columns}", params)
+
+    def question_stats(self, survey: str, by: tuple[str, ...] = ("semester",), semesters: list[str] | None = None) -> pd.DataFrame:
+        #weighted mean score per rubric question, e.g. to see whether a question drifted between cohorts
+        for column in by:
+            if column not in STAT_COLUMNS:
+                raise ValueError(f'cannot group by {column}, choose from {STAT_COLUMNS}')
+        where, params = filters(survey, semesters)
+        columns = ", ".join((*by, "question"))
+        return self.query(
+            f"SELECT {columns}, COUNT(*) AS responses, SUM(score * weight) / SUM(weight) AS mean_score "
+            f"FROM responses {where} GROUP BY {columns} ORDER BY {columns}", params)
+
+    def student_history(self, student: str) -> pd.DataFrame:
+        return self.query("SELECT semester, survey, section, group_name, score, points_possible, percent FROM scores WHERE student = ? ORDER BY semester, survey", (student,))
+
+
+def filters(survey: str | None, semesters: list[str] | None) -> tuple[str, list]:
+    clauses, params = [], []
+    if survey is not None:
+        clauses.append("survey = ?")
+        params.append(survey)
+    if semesters:
+        clauses.append(f"semester IN ({', '.join('?' * len(semesters))})")
+        params.extend(semesters)
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def rows_of(frame: pd.DataFrame):
+    #plain python values for sqlite, missing values become NULL
+    frame = frame.astype(object).where(frame.notna(), None)
+    return frame.itertuples(index=False, name=None)
@@ -0,0 +1,126 @@
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlparse
+
+import canvasapi
+import requests
+from requests.adapters import HTTPAdapter
+
+
+#Canvas starts every token with a 700 point request bucket, X-Rate-Limit-Remaining reports what is left
+RATE_LIMIT_LOW = 150
+RATE_LIMIT_HIGH = 500
+
+#throttled requests were not processed by Canvas, so any method can be sent again
+#Canvas also reports throttling as 403 "Rate Limit Exceeded", see is_throttled
+THROTTLE_STATUS = {429}
+#a server error or dropped connection may come after the request was applied, only these methods are safe to repeat
+SERVER_ERROR_STATUS = {500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+#SHARED HTTP SESSION FOR CANVASAPI WITH POOLING, ADAPTIVE THROTTLING, RETRIES AND LATENCY COUNTERS
+class CanvasSession(requests.Session):
+    # Installed as canvasapi's requester session, so every CanvasTool call goes through request() below
+    def __init__(self, max_concurrency: int = 8, min_concurrency: int = 1, retries: int = 4, backoff: float = 0.5):
+        super().__init__()
+        #keep-alive connections shared by the worker threads in CanvasTool
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        #current number of requests allowed in flight, moved up and down from the rate limit headers
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+        self.retries = retries
+        self.backoff = backoff
+
+        #{endpoint: count} and {endpoint: total seconds}
+        self.calls = Counter()
+        self.latency = defaultdict(float)
+        self.retried = Counter()
+        self.rate_limit_remaining = None
+
+    def install(self, canvas: canvasapi.Canvas):
+        #canvasapi has no option for a custom session, so this replaces the one its Requester creates
+        #that Requester is private to canvasapi, requirements.txt pins the version this was written against
+        requester = getattr(canvas, "_Canvas__requester", None)
+        if not isinstance(getattr(requester, "_session", None), requests.Session):
+            raise RuntimeError(f'canvasapi {canvasapi.__version__} does not keep a requests session where CanvasSession expects it, '
+                               f'install the canvasapi version pinned in requirements.txt')
+        requester._session = self
+
+    def request(self, method, url, *args, **kwargs):
+        #ids are folded so calls group by endpoint
+        path = re.sub(r"/\d+", "/:id", urlparse(url).path)
+        endpoint = f'{method.upper()} {path}'
+        #a POST (new group, membership, bulk grade update) is never repeated after a 5xx or a lost connection
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        for attempt in range(self.retries + 1):
+            with self.condition:
+                while self.in_flight >= self.limit:
+                    self.condition.wait()
+                self.in_flight += 1
+
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except requests.ConnectionError:
+                if attempt == self.retries or not idempotent:
+                    raise
+                response = None
+            finally:
+                with self.condition:
+                    self.in_flight -= 1
+                    self.condition.notify_all()
+
+            with self.condition:
+                self.calls[endpoint] += 1
+                self.latency[endpoint] += time.perf_counter() - start
+            if response is not None:
+                self.adapt(response)
+                if not self.should_retry(response, idempotent):
+                    return response
+                if attempt == self.retries:
+                    return response
+
+            with self.condition:
+                self.retried[endpoint] += 1
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def is_throttled(self, response) -> bool:
+        if response.status_code in THROTTLE_STATUS:
+            return True
+        #403 is also a real permission error, only retry when Canvas says it is throttling
+        return response.status_code == 403 and "rate limit exceeded" in response.text.lower()
+
+    def should_retry(self, response, idempotent: bool) -> bool:
+        return self.is_throttled(response) or (idempotent and response.status_code in SERVER_ERROR_STATUS)
+
+    def adapt(self, response):
+        #halve concurrency when the bucket runs low or Canvas throttles, grow back one at a time when it refills
+        remaining = response.headers.get("X-Rate-Limit-Remaining")
+        with self.condition:
+            if self.is_throttled(response):
+                self.limit = self.min_concurrency
+            elif remaining is not None:
+                self.rate_limit_remaining = float(remaining)
+                if self.rate_limit_remaining < RATE_LIMIT_LOW:
+                    self.limit = max(self.min_concurrency, self.limit // 2)
+                elif self.rate_limit_remaining > RATE_LIMIT_HIGH:
+                    self.limit = min(self.max_concurrency, self.limit + 1)
+            self.condition.notify_all()
+
+    def report(self) -> list[str]:
+        lines = []
+        for endpoint, count in self.calls.most_common():
+            average = self.latency[endpoint] / count * 1000
+            retried = f', {self.retried[endpoint]} retried' if self.retried[endpoint] else ''
+            lines.append(f'{count:6d}  {average:8.1f} ms avg  {endpoint}{retried}')
+        return lines
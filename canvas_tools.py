@@ -1,9 +1,41 @@
 # Import the Canvas class
 from canvasapi import Canvas
+from canvasapi.exceptions import CanvasException
+from canvas_session import CanvasSession
+from roster import Roster, Student, ROSTER_CACHE, read_roster_cache
 import tomllib 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+import hashlib
+import requests
 import yaml
 import argparse
+import time
+import json
+import os
+
+#concurrent requests used when group memberships have to be fetched group by group
+ROSTER_WORKERS = 8
+
+#bulk grade uploads are split into chunks that Canvas processes as separate background jobs
+BULK_CHUNK_SIZE = 50
+BULK_WORKERS = 4
+BULK_RETRIES = 2
+#seconds between polls of a bulk update Progress object
+PROGRESS_POLL_INTERVAL = 1.0
+
+#Canvas keeps scores to two decimals, local scores are rounded the same way before they are compared
+CANVAS_SCORE_DECIMALS = 2
+
+def grade_fingerprint(score, comment: str) -> str:
+    #content hash of a grade and comment, whitespace is normalized per line so re-indented text still matches
+    try:
+        score = f'{round(float(score), CANVAS_SCORE_DECIMALS):.{CANVAS_SCORE_DECIMALS}f}'
+    except (TypeError, ValueError):
+        score = str(score)
+    text = "\n".join(line.strip() for line in str(comment or "").strip().splitlines())
+    return hashlib.sha1(f'{score}|{text}'.encode("utf-8")).hexdigest()
 
 class CanvasTool:
     # Positions of points, rects, displacements
@@ -18,60 +50,152 @@ class CanvasTool:
             COURSE_ID = config['canvas']['COURSE_ID']
         
         canvas = Canvas(API_URL, API_KEY)
-        self.course = canvas.get_course(COURSE_ID)
 
-        self.group_categories = self.course.get_group_categories()
+        #route canvasapi through one pooled, rate limit aware session that also times every endpoint
+        self.session = CanvasSession()
+        self.session.install(canvas)
+        self.started = time.perf_counter()
+
+        #total_students is part of the roster change check
+        self.course = canvas.get_course(COURSE_ID, include=['total_students'])
+
+    #course data below is only requested the first time a command uses it, then reused
+    @cached_property
+    def group_categories(self):
+        return list(self.course.get_group_categories())
+
+    @cached_property
+    def project_group_category(self):
         for category in self.group_categories:
             if category.name == 'Project Groups':
-                self.project_groups_category_id = category.id
-                self.project_group_category = category
+                return category
+        raise ValueError('Course has no "Project Groups" group category.')
 
-        self.groups = self.project_group_category.get_groups()
-        self.teachers = self.course.get_users(enrollment_type=['teacher'])
+    @property
+    def project_groups_category_id(self):
+        return self.project_group_category.id
 
-        self.sections = self.course.get_sections()
-    
-    def find_student_data(self):
+    @cached_property
+    def groups(self):
+        return list(self.project_group_category.get_groups())
+
+    @cached_property
+    def teachers(self):
+        return list(self.course.get_users(enrollment_type=['teacher']))
+
+    @cached_property
+    def sections(self):
+        return list(self.course.get_sections())
+
+    def print_http_report(self, command: str):
+        elapsed = time.perf_counter() - self.started
+        print(f'{command}: {sum(self.session.calls.values())} Canvas HTTP calls in {elapsed:.2f}s')
+        for line in self.session.report():
+            print(line)
+
+    def roster_fingerprint(self) -> dict:
+        #cheap summary of the roster, any add, drop or group move changes a count here
+        return {
+            "total_students": getattr(self.course, 'total_students', None),
+            "groups": {group.name: getattr(group, 'members_count', None) for group in self.groups},
+        }
+
+    def load_cached_roster(self):
+        #returns the cached Roster if it belongs to this course, is recent and still matches Canvas
+        cached = read_roster_cache(self.course.id)
+        if cached is None:
+            return None
+        if cached["fingerprint"] != self.roster_fingerprint():
+            print('roster changed in Canvas, reloading')
+            return None
+        return Roster.from_records(cached["students"])
+
+    def save_roster(self):
+        os.makedirs(ROSTER_CACHE.parent, exist_ok=True)
+        cached = {
+            "course_id": self.course.id,
+            "saved_at": time.time(),
+            "fingerprint": self.roster_fingerprint(),
+            "students": self.roster.to_records(),
+        }
+        tmp = ROSTER_CACHE.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(cached, f)
+        os.replace(tmp, ROSTER_CACHE)
+
+    def find_student_data(self, refresh: bool = False):
         #use this function to gather all relevent student data
-        self.student_data = {}
+        #the roster is reused from .cache/roster.json unless refresh is set or Canvas reports a change
+        if not refresh:
+            cached = self.load_cached_roster()
+            if cached is not None:
+                self.roster = cached
+                print(f'using cached roster of {len(self.roster)} students (--refresh-roster to reload)')
+                return
+
+        self.fetch_student_data()
+        self.save_roster()
+
+    def fetch_student_data(self):
+        #crawl enrollments and groups from Canvas
+        self.roster = Roster()
+        timings = {}
+
+        start = time.perf_counter()
+        section_names = {section.id: section.name for section in self.sections}
+        groups = self.groups
+        group_names = {group.id: group.name for group in groups}
+        timings['sections and groups'] = time.perf_counter() - start
+
+        #one course level query instead of one per section, group ids come back with each enrollment
+        start = time.perf_counter()
+        enrollments = self.course.get_enrollments(type=["StudentEnrollment"], include=["group_ids"], per_page=100)
+        has_group_ids = False
+        for enrollment in enrollments:
+            user = enrollment.user
+            student_name = user['name']
+            email_id = user['login_id']
+            section_name = section_names.get(enrollment.course_section_id, 'None')
+
+            group_ids = user.get('group_ids', getattr(enrollment, 'group_ids', None))
+            has_group_ids = has_group_ids or group_ids is not None
+            group_name = next((group_names[g] for g in group_ids or [] if g in group_names), 'None')
+            self.roster.add(Student(student_name, section_name, group_name, email_id, id=user['id']))
+        timings['enrollments'] = time.perf_counter() - start
+
+        #older Canvas instances ignore include[]=group_ids, fall back to reading every group concurrently
+        if not has_group_ids:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=ROSTER_WORKERS) as pool:
+                memberships = pool.map(lambda group: (group.name, list(group.get_users())), groups)
+                for group_name, members in memberships:
+                    for member in members:
+                        if member.id in self.roster.by_id:
+                            self.roster.move(self.roster.by_id[member.id], group_name)
+            timings['group memberships'] = time.perf_counter() - start
+
+        for phase, seconds in timings.items():
+            print(f'roster {phase}: {seconds:.2f}s')
+        print(f'loaded {len(self.roster)} students in {sum(timings.values()):.2f}s')
 
-        #go through each section
-        for section in self.sections:
-            section_name = section.name
-            enrollments = section.get_enrollments(type=["StudentEnrollment"])
-            #list each student in each section add them to main list
-            for enrollment in enrollments:
-                user = enrollment.user
-                student_name = user['name']
-                email_id = user['login_id']
-                self.student_data.update({student_name:[user['id'],section_name,'None',email_id]})
-        #add students to groups
-        for group in self.groups:
-            members = group.get_users()
-            for member in members:
-                self.student_data[member.name][2]= group.name
-        
 
 
     def print_survey_config(self):
         #use this function to create the secrets file for survey configuration
         print(f'\nPaste this into your secrets.toml file:\n')
         print('students = [')
-        for student in self.student_data:
-            section = self.student_data[student][1].split('-')[-1]
-            group = self.student_data[student][2].replace(" ","")
-            email_id = self.student_data[student][3]
-            print(f'"{section},{group},{student},{email_id}",')
+        for student in self.roster:
+            section = student.section.split('-')[-1]
+            group = student.group.replace(" ","")
+            print(f'"{section},{group},{student.name},{student.login}",')
         print(']')
 
     def print_student_grops(self):
         #use this function to create the secrets file for survey configuration
         student_list = []
-        for student in self.student_data:
-            section = self.student_data[student][1].split('-')[-1]
-            group = self.student_data[student][2].replace(" ","")
-            email_id = self.student_data[student][3]
-            student_list.append((group,[student,email_id]))
+        for student in self.roster:
+            group = student.group.replace(" ","")
+            student_list.append((group,[student.name,student.login]))
             
         student_list_sorted = sorted(student_list)
         for stuff in student_list_sorted:
@@ -98,25 +222,101 @@ class CanvasTool:
 
         print(f"Uploaded grade {score} for user {student_id} with comment: {comment}")
 
-    def upload_bulk_grades(self, assignment_id: int, grades: dict):
+    def current_grade_fingerprints(self, assignment_id: int, student_ids: list | None = None) -> dict[int, set[str]]:
+        #one paginated read of every submission with its comments, {student_id: {fingerprint}}
+        #student_ids limits the read to those students, e.g. one chunk after a failed bulk update
+        if student_ids is None:
+            submissions = self.course.get_assignment(assignment_id).get_submissions(include=['submission_comments'], per_page=100)
+        else:
+            submissions = self.course.get_multiple_submissions(assignment_ids=[assignment_id], student_ids=list(student_ids), include=['submission_comments'], per_page=100)
+        fingerprints = {}
+        for submission in submissions:
+            if submission.score is None:
+                continue
+            comments = [c.get('comment', '') for c in getattr(submission, 'submission_comments', None) or []]
+            fingerprints[submission.user_id] = {grade_fingerprint(submission.score, comment) for comment in comments + [""]}
+        return fingerprints
+
+    def changed_grades(self, assignment_id: int, grades: dict) -> dict:
+        #keep only students whose score differs or whose comment has not been posted yet
+        current = self.current_grade_fingerprints(assignment_id)
+        changed = {}
+        for student_id, (score, comment) in grades.items():
+            if grade_fingerprint(score, comment) not in current.get(int(student_id), set()):
+                changed[student_id] = (score, comment)
+        print(f"{len(changed)} of {len(grades)} grades changed for assignment {assignment_id}")
+        return changed
+
+    def upload_bulk_grades(self, assignment_id: int, grades: dict, chunk_size: int = BULK_CHUNK_SIZE, workers: int = BULK_WORKERS, retries: int = BULK_RETRIES, force: bool = False):
         #use this to submit a bunch of grades at once
         #grades dict in form {student_id:('posted_grade':'comments')}
-        
-        grade_data = {}
-        for student_id, (score, comment) in grades.items():
-            grade_data[str(student_id)] = {
-                "posted_grade": score,
-                "text_comment": comment
-            }
-        self.course.submissions_bulk_update(
-            assignment_id=assignment_id,
-            grade_data=grade_data
-        )
-        print(f"Uploaded {len(grades)} grades for assignment {assignment_id}")
+        #unchanged submissions are skipped unless force is set, so re-runs do not duplicate comments
+        #grades are sent in chunks concurrently and each chunk's background job is polled until Canvas finishes it
+        #returns the student ids whose chunk still failed after retries
+        if not force:
+            grades = self.changed_grades(assignment_id, grades)
+            if not grades:
+                return []
+
+        start = time.perf_counter()
+        items = list(grades.items())
+        chunks = [dict(items[i:i + chunk_size]) for i in range(0, len(items), chunk_size)]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda chunk: self.upload_grade_chunk(assignment_id, chunk, retries), chunks))
+
+        failed = [student_id for chunk, ok in zip(chunks, results) if not ok for student_id in chunk]
+        uploaded = len(grades) - len(failed)
+        elapsed = time.perf_counter() - start
+        rate = uploaded / elapsed if elapsed else 0
+        print(f"Uploaded {uploaded}/{len(grades)} grades for assignment {assignment_id} in {len(chunks)} chunks, {elapsed:.2f}s ({rate:.1f} grades/s)")
+        if failed:
+            print(f"Failed to upload grades for student ids: {failed}")
+        return failed
+
+    def upload_grade_chunk(self, assignment_id: int, grades: dict, retries: int = BULK_RETRIES) -> bool:
+        #submit one chunk and wait for its Progress to finish, retrying with backoff on failure
+        #a failed job may have applied part of the chunk, so a retry only resends students whose grade and comment are not in Canvas yet
+        for attempt in range(retries + 1):
+            try:
+                if attempt:
+                    time.sleep(2 ** (attempt - 1))
+                    current = self.current_grade_fingerprints(assignment_id, grades.keys())
+                    grades = {student_id: (score, comment) for student_id, (score, comment) in grades.items()
+                              if grade_fingerprint(score, comment) not in current.get(int(student_id), set())}
+                    if not grades:
+                        return True
+                    print(f"Resending {len(grades)} grades that were not applied")
+
+                grade_data = {}
+                for student_id, (score, comment) in grades.items():
+                    grade_data[str(student_id)] = {
+                        "posted_grade": score,
+                        "text_comment": comment
+                    }
+                progress = self.course.submissions_bulk_update(
+                    assignment_id=assignment_id,
+                    grade_data=grade_data
+                )
+                progress = self.wait_for_progress(progress)
+                if progress.workflow_state == 'completed':
+                    return True
+                print(f"Bulk update of {len(grades)} grades {progress.workflow_state}: {getattr(progress, 'message', '')}")
+            except (CanvasException, requests.ConnectionError) as e:
+                #the session does not repeat a POST after a dropped connection, the next attempt re-reads what was applied
+                print(f"Bulk update of {len(grades)} grades raised {e}")
+        return False
+
+    def wait_for_progress(self, progress):
+        #poll a canvasapi Progress until its job is no longer queued or running
+        while progress.workflow_state in ('queued', 'running'):
+            time.sleep(PROGRESS_POLL_INTERVAL)
+            progress = progress.query()
+        return progress
     
-    def upload_groups(self):
+    def upload_groups(self, dry_run: bool = False):
         #add more error checking
-        error = False
+        ungrouped_students = False
         with open("groups.yml", "r") as f:
             data = yaml.safe_load(f)
 
@@ -138,33 +338,58 @@ class CanvasTool:
                     print(f'{double_booked_student} is in more than one group. Please resolve in groups.yml')
                     return
         
-        if ungrouped_students:
+        if ungrouped_students and not dry_run:
             user_data = input('Do you wish to continue before resolving these conflicts? (Y/N)\n').strip().lower()
             if user_data == 'n':
                 return
 
-        existing_canvas_group_names = []
-        for g in self.groups:
-            existing_canvas_group_names.append(g.name)
-
-        #create necessary groups
+        #index Canvas groups by name once instead of re-listing them for every student
+        groups_by_name = {g.name: g for g in self.groups}
+        new_groups = []
+        #{group name: [students to add]}, students already in their group are left alone
+        additions = {}
+        unknown_students = []
         for group in data['Groups']:
             group_name = list(group.keys())[0]
-            if group_name not in existing_canvas_group_names:
-                self.project_group_category.create_group(name=group_name)
-                print(f'gonna create {group_name}')
-
-        #add students to respective groups
-        for groups in data['Groups']:
-            group_name = list(groups.keys())[0]
-            for student in groups[group_name]['Group Members']:
-                groups = list(self.project_group_category.get_groups())
-                #print(f'loading group {group_name}')
-                canvas_group = next((g for g in groups if g.name == group_name), None)
-                if canvas_group != None:
-                    uid = self.student_data[student][0]
-                    print(f'adding student {student} to group {canvas_group.name}')
-                    canvas_group.create_membership(user=uid)
+            if group_name not in groups_by_name:
+                new_groups.append(group_name)
+            for student in group[group_name]['Group Members']:
+                if student not in self.roster:
+                    unknown_students.append(student)
+                elif self.roster.by_name[student].group != group_name:
+                    additions.setdefault(group_name, []).append(student)
+
+        print(f'groups to create: {len(new_groups)}')
+        for group_name in new_groups:
+            print(f'  + {group_name}')
+        print(f'students to add: {sum(len(members) for members in additions.values())} (unchanged: {len(students) - len(unknown_students) - sum(len(members) for members in additions.values())})')
+        for group_name, members in additions.items():
+            for student in members:
+                print(f'  {student}: {self.roster.by_name[student].group} -> {group_name}')
+        for student in unknown_students:
+            print(f'  {student} is not enrolled in Canvas, skipped')
+
+        if dry_run:
+            return
+
+        #create necessary groups, the returned groups go straight into the index
+        for group_name in new_groups:
+            groups_by_name[group_name] = self.project_group_category.create_group(name=group_name)
+            print(f'created group {group_name}')
+        if new_groups:
+            self.__dict__.pop('groups', None)
+
+        #add students to respective groups with a bounded pool of concurrent requests
+        def add_member(job):
+            group_name, student = job
+            groups_by_name[group_name].create_membership(user=self.roster.by_name[student].id)
+            return group_name, student
+
+        jobs = [(group_name, student) for group_name, members in additions.items() for student in members]
+        with ThreadPoolExecutor(max_workers=ROSTER_WORKERS) as pool:
+            for group_name, student in pool.map(add_member, jobs):
+                print(f'added student {student} to group {group_name}')
+                self.roster.move(self.roster.by_name[student], group_name)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -177,24 +402,31 @@ def main():
         help="MyCanvas class functions"
     )
 
-    # parser.add_argument(
-    #     "--value",
-    #     type=int,
-    #     default=0,
-    #     help="Optional value for run()"
-    # )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="upload_groups: print the groups and memberships that would change without changing Canvas"
+    )
+
+    parser.add_argument(
+        "--refresh-roster",
+        action="store_true",
+        help="Ignore the cached roster in .cache/roster.json and reload it from Canvas"
+    )
 
     args = parser.parse_args()
 
     mycanvas = CanvasTool()
-    mycanvas.find_student_data()
+    mycanvas.find_student_data(refresh=args.refresh_roster)
 
     # ---- Dispatch ----
     if args.command == "generate_secrets":
         mycanvas.print_survey_config()
     
     if args.command == 'upload_groups':
-        mycanvas.upload_groups()
+        mycanvas.upload_groups(dry_run=args.dry_run)
+
+    mycanvas.print_http_report(args.command)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+import datetime
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from rubrics import tally
+
+
+EXPORT_DIR = Path("exports")
+
+#column -> dtype, every semester is written with exactly these columns so files from different years concatenate
+RESPONSE_SCHEMA = {
+    "semester": "string", "survey": "string", "reviewer": "string", "response_key": "string", "reviewee": "string",
+    "response_type": "string", "weight": "float64", "question": "string", "score": "float64",
+}
+STUDENT_SCHEMA = {
+    "semester": "string", "survey": "string", "student": "string", "section": "string", "group": "string",
+    "score": "float64", "points_possible": "float64", "percent": "float64",
+}
+GROUP_SCHEMA = {
+    "semester": "string", "survey": "string", "group": "string", "question": "string",
+    "points": "float64", "possible": "float64", "ratio": "float64",
+}
+SCHEMAS = {"responses": RESPONSE_SCHEMA, "students": STUDENT_SCHEMA, "groups": GROUP_SCHEMA}
+
+
+def current_semester(today: datetime.date | None = None) -> str:
+    #e.g. 2026SP, 2026SS or 2026FS, spring runs through May and summer through July
+    today = today or datetime.date.today()
+    term = "SP" if today.month < 6 else "SS" if today.month < 8 else "FS"
+    return f"{today.year}{term}"
+
+
+def with_schema(frame: pd.DataFrame, schema: dict[str, str]) -> pd.DataFrame:
+    #same columns, same order, same dtypes whatever the survey produced
+    frame = frame.reindex(columns=list(schema))
+    return frame.astype(schema)
+
+
+def response_rows(semester: str, survey: str, table: pd.DataFrame, rubrics: list) -> pd.DataFrame:
+    #one row per (response, reviewee, question), questions a response did not answer are left out
+    fields = list(dict.fromkeys(field for rubric in rubrics for field in rubric.fields))
+    rows = table.melt(id_vars=["reviewer", "key", "reviewee", "response_type", "weight"], value_vars=fields, var_name="question", value_name="score")
+    rows = rows.dropna(subset=["score"]).rename(columns={"key": "response_key"})
+    #a 0 on a skip_zero rubric means the question was skipped, tally leaves it out so the export does too
+    skipped_fields = [field for rubric in rubrics if rubric.skip_zero for field in rubric.fields]
+    rows = rows[~(rows["question"].isin(skipped_fields) & (np.trunc(rows["score"]) == 0))]
+    rows.insert(0, "survey", survey)
+    rows.insert(0, "semester", semester)
+    return with_schema(rows, RESPONSE_SCHEMA)
+
+
+def student_rows(semester: str, survey: str, gradebook: dict, points_possible: float, sections: dict, groups: dict) -> pd.DataFrame:
+    #one row per graded student, the text feedback stays in the gradebook
+    students = list(gradebook)
+    scores = np.array([gradebook[student][0] for student in students], dtype=float)
+    rows = pd.DataFrame({
+        "semester": semester,
+        "survey": survey,
+        "student": students,
+        "section": [sections.get(student) for student in students],
+        "group": [groups.get(student) for student in students],
+        "score": scores,
+        "points_possible": float(points_possible),
+        "percent": scores / points_possible * 100,
+    })
+    return with_schema(rows, STUDENT_SCHEMA)
+
+
+def group_rows(semester: str, survey: str, table: pd.DataFrame, rubrics: list, groups: dict) -> pd.DataFrame:
+    #rubric sums added up per group and question, reviewees without a known group are dropped
+    rows = table.assign(reviewee=table["reviewee"].map(lambda reviewee: groups.get(reviewee))).dropna(subset=["reviewee"])
+    #a group review is copied to every member it names, each response counts once per group
+    rows = rows.drop_duplicates(subset=["key", "reviewee"])
+    frames = []
+    for rubric in rubrics:
+        scores = tally(rows, rubric)
+        for j, field in enumerate(rubric.fields):
+            frames.append(pd.DataFrame({"group": scores.keys, "question": field, "points": scores.pts[:, j], "possible": scores.total[:, j]}))
+    if not frames:
+        return with_schema(pd.DataFrame(), GROUP_SCHEMA)
+
+    rows = pd.concat(frames, ignore_index=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rows["ratio"] = rows["points"] / rows["possible"]
+    rows.insert(0, "survey", survey)
+    rows.insert(0, "semester", semester)
+    return with_schema(rows, GROUP_SCHEMA)
+
+
+def write_tables(tables: dict[str, pd.DataFrame], semester: str, out_dir: str | Path = EXPORT_DIR, formats: tuple[str, ...] = ("parquet", "csv")) -> list[Path]:
+    #writes <out_dir>/<semester>/<table>.<format> and returns the files written
+    semester_dir = Path(out_dir) / semester
+    os.makedirs(semester_dir, exist_ok=True)
+    written = []
+    for name, table in tables.items():
+        if "parquet" in formats:
+            path = semester_dir / f"{name}.parquet"
+            table.to_parquet(path, index=False)
+            written.append(path)
+        if "csv" in formats:
+            path = semester_dir / f"{name}.csv"
+            table.to_csv(path, index=False)
+            written.append(path)
+    return written
+
+
+def load_results(table: str, out_dir: str | Path = EXPORT_DIR, semesters: list[str] | None = None, columns: list[str] | None = None) -> pd.DataFrame:
+    #read one exported table across semesters, parquet files are memory mapped and only the asked for columns are read
+    frames = []
+    #nothing exported yet reads as an empty table
+    semester_dirs = sorted(Path(out_dir).iterdir()) if Path(out_dir).is_dir() else []
+    for semester_dir in semester_dirs:
+        path = semester_dir / f"{table}.parquet"
+        if path.exists() and (semesters is None or semester_dir.name in semesters):
+            frames.append(pd.read_parquet(path, columns=columns, memory_map=True))
+    if not frames:
+        return with_schema(pd.DataFrame(), SCHEMAS[table])[columns or list(SCHEMAS[table])]
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,122 @@
+from string import Template
+
+import numpy as np
+
+
+#course comments from the final peer evaluation are collected here, once per grading run
+COURSE_FEEDBACK_FILE = "me4842_feedback.txt"
+
+
+#FEEDBACK TEMPLATES, COMPILED ONCE AND FILLED FROM PRE-FORMATTED SCORE COLUMNS
+MIDTERM_PEER_EVALUATION_FEEDBACK = Template("""
+            ---------------------------------------------------
+            ${student}
+            ---------------------------------------------------
+            Standard Lab participation: ${labs} / 10
+            Contribution to group memos: ${memos_score} / 10
+            Participation in group discussions / meetings: ${meetings_score} / 10
+            Work on final experiment: ${final_project_score} / 10
+            
+            ---------------------------------------------------
+            Peer Evaluation Grade: ${score}/10 ----> ${percent}%
+            ---------------------------------------------------
+            Comments: ${comments} 
+
+
+            """)
+
+FINAL_PEER_EVALUATION_FEEDBACK = Template("""
+            ---------------------------------------------------
+            ${student}
+            ---------------------------------------------------
+            Standard Lab participation: ${labs_and_memos} / 10
+            Participation during group meetings: ${meetings_score} / 10
+            Work on final experiment: ${final_project_score} / 10
+            ---------------------------------------------------
+            Peer Evaluation Grade: ${score}/10 ----> ${percent}%
+            ---------------------------------------------------
+            Comments: ${comments} 
+
+
+            """)
+
+SYMPOSIUM_FEEDBACK = Template("""
+
+            ---------------------------------------------------
+            Poster Symposium Score: ${group}
+            ---------------------------------------------------
+            Technical Content: ${technical_content}%
+            Presentation Completeness: ${completeness}%
+            Presentation Quality: ${presentation_quality}%
+            Ability to Answer Questions: ${answering_questions}%
+            
+            Group Score: ${percent}%
+            Group Points: ${score} / 50
+
+            Inidvidual Feedback Recieved: ${comments} 
+            """)
+
+PROPOSAL_FEEDBACK = Template("""
+            ---------------------------------------------------
+            Individual Scores: ${student}
+            ---------------------------------------------------
+            Dress Code: ${dress_code_score}%
+            Audience Engagement: ${audience_engagement_score}%
+            Body Language: ${body_language_score}%
+            Enthusiasm: ${enthusiasm_score}%
+            Speaking: ${overall_score}%
+            
+            Individual Score: ${individual_percent}%
+            Individual Points: ${individual_points} / 25
+
+            Inidvidual Feedback Recieved: ${individual_comments} 
+            ---------------------------------------------------
+            Group Scores: ${group}
+            ---------------------------------------------------
+            Technical: ${technical_content_score}%
+            Efficacy: ${experimental_efficacy_score}%
+            Completeness: ${completeness_score}%
+            Presentation Quality: ${presentation_quality_score}%
+            Ability to Answer Questions: ${answering_questions_score}%
+            
+            Group Score: ${group_percent}%
+            Group Points: ${group_points} / 10
+            
+            Group Feedback Recieved: ${group_comments}
+            ---------------------------------------------------
+            Final Assignment Grade
+            ---------------------------------------------------
+            Group Score + Individual Score = Overall Score
+            
+            ${individual_points} + ${group_points}  = ${score}/35 ----> ${percent}%\n
+
+            """)
+
+
+def formatted(values) -> list[str]:
+    #two decimal strings for a whole column, matches the {value:.2f} the templates replaced
+    return [f'{value:.2f}' for value in np.asarray(values, dtype=float)]
+
+
+def bullets(comments: list[str]) -> str:
+    return "\n-" + "\n-".join(comments)
+
+
+def rubric_columns(scores, scale: float, rows: list[int]) -> dict[str, list[str]]:
+    #every question of a Tally as a column of ratio * scale for the given rows, keyed by question name
+    return {field: formatted(scores.ratio(field)[rows] * scale) for field in scores.rubric.fields}
+
+
+def render(template: Template, columns: dict[str, list]) -> list[str]:
+    #fill the template once per row, every column holds one ready-made string per row
+    names = list(columns)
+    return [template.substitute(dict(zip(names, row))) for row in zip(*columns.values())]
+
+
+def write_course_feedback(responses: list[str], path: str = COURSE_FEEDBACK_FILE):
+    sep = "\n" + "=" * 80 + "\n"
+    with open(path, "w", encoding="utf-8") as f:
+        for i, response in enumerate(responses, start=1):
+            f.write(f"Response {i}\n")
+            f.write(response.rstrip())
+            f.write(sep)
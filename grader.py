@@ -1,359 +1,368 @@
-import gspread
 import toml
 import json
 import pandas as pd
-from pprint import pprint
 from collections import Counter
 import yaml
 import stutts_picker as picker
 import os
 import shutil
-import firebase_admin
-from firebase_admin import credentials, db
 import streamlit as st
-import numpy as np
 import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
+from rubrics import Rubric, build_table, tally
+from feedback import (MIDTERM_PEER_EVALUATION_FEEDBACK, FINAL_PEER_EVALUATION_FEEDBACK, SYMPOSIUM_FEEDBACK, PROPOSAL_FEEDBACK,
+                      bullets, formatted, render, rubric_columns, write_course_feedback)
+from roster import Roster, ROSTER_MAX_AGE
+from snapshots import SurveySnapshot
+from survey_store import SurveyStore, DEFAULT_TTL
+import export
+from archive import SemesterArchive, ARCHIVE_PATH
+
+
+#proposal presentation rubric, individual questions are rated with labels and group questions 0-10
+RATING_MAP = {"Substandard": 2,"Poor": 2.75,"Acceptable": 3.5,"Good": 4.25,"Excellent": 5}
+PROPOSAL_INDIVIDUAL = Rubric(["dress_code_score", "audience_engagement_score", "body_language_score", "enthusiasm_score", "overall_score"],
+                             scale=5, weight='scoring_weight', comment='written_feedback', labels=RATING_MAP, response_type='Individual')
+PROPOSAL_GROUP = Rubric(["technical_content_score", "experimental_efficacy_score", "completeness_score", "presentation_quality_score", "answering_questions_score"],
+                        scale=10, weight='scoring_weight', skip_zero=True, comment='written_feedback', response_type='Group')
+
+#peer evaluations are 1-5 per question, the symposium is scored 0-100 per question with 0 meaning skipped
+MIDTERM_PEER_EVALUATION = Rubric(["labs", "meetings_score", "memos_score", "final_project_score"], scale=5, comment='comments')
+FINAL_PEER_EVALUATION = Rubric(["labs_and_memos", "meetings_score", "final_project_score"], scale=5, comment='comments')
+SYMPOSIUM = Rubric(["answering_questions", "technical_content", "completeness", "presentation_quality"], scale=100, skip_zero=True, comment='feedback')
+
+#survey name -> (Firebase node, grading method, points possible), in the column order of the combined gradebook
+SURVEYS = {
+    'proposal': ('Proposal_Responses', 'grade_prop', 35),
+    'midterm_peer_evaluation': ('Midterm_Peer_Evaluations', 'grade_midterm_peer_evaluation', 10),
+    'final_peer_evaluation': ('Final_Peer_Evaluations', 'grade_final_peer_evaluation', 10),
+    'symposium': ('Poster_Symposium_Evaluation', 'grade_symposium', 50),
+}
+#surveys whose responses review a whole group rather than one student
+GROUP_SURVEYS = {'symposium'}
 
 
 #GRADER FOR ME4842 SURVEYS, THIS USES A STANDARD RESPONSE AND GRADEBOOK FOR ALL ASSIGNMENTS
 class Grader:
     # Positions of points, rects, displacements
-    def __init__(self):
-        #student response book shape is {name: [assignment_id,responses]}
-        self.student_responsebook = {}
-
-        #student gradebook shape is {name: [weight, score, written_feedback]}
-        self.student_gradebook = {}
-
-    if not firebase_admin._apps:
-        #database authentication
-        cred = dict(st.secrets["firebase_creds"])
-        cred = credentials.Certificate(cred)
-        firebase_admin.initialize_app(cred, {"databaseURL": st.secrets['database_url']['url']})
+    def __init__(self, incremental: bool = False, offline: bool = False, cache_ttl: float = DEFAULT_TTL, chunk_size: int | None = None, feedback: bool = True,
+                 keep_tables: bool = False):
+        #each survey keeps its own gradebook {survey: {name: [score, written_feedback]}}
+        self.gradebooks = {}
+
+        #combined scores from grade_all, one row per student and one column per survey
+        self.gradebook = None
+        #per-response tables from the last load of each node {node: DataFrame}, only filled with keep_tables
+        self.tables = {}
+        #exports and the archive need every response, plain grading only needs the running tallies
+        self.keep_tables = keep_tables
+        #SemesterArchive, opened on first use
+        self.archive = None
+
+        #incremental runs only fetch and score responses newer than the local snapshot
+        self.incremental = incremental
+        self.snapshots = {}
+
+        #all Firebase reads go through the on-disk cache, offline runs only use the cache
+        self.store = SurveyStore(ttl=cache_ttl, offline=offline)
+        #None reads each survey node in one request, otherwise reviewers are listed shallowly and fetched chunk_size at a time
+        self.chunk_size = chunk_size
+        #False skips rendering text feedback (and the course feedback file) when only scores are needed
+        self.feedback = feedback
+
+    def stream_survey(self, node: str, key: str, rubrics: list[Rubric], snapshot: SurveySnapshot, extra: list[str] = (), skip_keys: tuple[str, ...] = ()):
+        #yield (table, affected reviewees) for each chunk of reviewers once its scores are folded into snapshot
+        #reviewers arrive in key order a chunk at a time, each chunk is scored while the next one is fetched
+        #incremental runs only ask for responses pushed after the last key scored per reviewer
+        empty = True
+        for responses in self.store.iter_chunks(node, chunk_size=self.chunk_size, after=snapshot.last_keys):
+            table = build_table(responses, key, rubrics, extra=extra, skip_keys=skip_keys)
+            keys = pd.Index(pd.unique(table["reviewee"]))
+            empty = False
+            yield table, snapshot.update(responses, table, [tally(table, rubric, keys) for rubric in rubrics], extra, skip_keys)
+
+        if empty:
+            table = build_table({}, key, rubrics, extra=extra, skip_keys=skip_keys)
+            yield table, snapshot.update({}, table, [tally(table, rubric) for rubric in rubrics], extra, skip_keys)
+
+    def load_survey(self, node: str, key: str, rubrics: list[Rubric], extra: list[str] = (), skip_keys: tuple[str, ...] = ()):
+        #fetch and score a survey node, returns (snapshot, affected reviewees)
+        #each chunk's table is dropped once scored unless keep_tables asks for the whole table
+        snapshot = SurveySnapshot.load(node, rubrics) if self.incremental else SurveySnapshot(node, rubrics)
+        tables = []
+        affected = set()
+        for table, changed in self.stream_survey(node, key, rubrics, snapshot, extra, skip_keys):
+            affected |= changed
+            if self.keep_tables:
+                tables.append(table)
+
+        self.snapshots[node] = snapshot
+        if self.keep_tables:
+            self.tables[node] = pd.concat(tables, ignore_index=True)
+        return snapshot, affected
+
+    def save_snapshot(self, node: str, gradebook: dict):
+        #remember scores and feedback so the next incremental run can reuse unaffected students
+        #score only runs have no feedback to remember, so they leave the snapshot alone
+        if self.incremental and self.feedback:
+            snapshot = self.snapshots[node]
+            snapshot.gradebook = gradebook
+            snapshot.save()
+
+    def grade_all(self, surveys: list[str] | None = None) -> pd.DataFrame:
+        #grade several surveys in one pass, every node is fetched concurrently up front then graded in parallel
+        surveys = list(surveys or SURVEYS)
+        start = time.perf_counter()
+
+        #incremental and chunked runs read only part of each node, so they fetch inside their own survey
+        if not self.incremental and self.chunk_size is None:
+            self.store.prefetch([SURVEYS[survey][0] for survey in surveys])
+        fetched = time.perf_counter()
+
+        #surveys share nothing but the store, each grade_* call builds its own table, snapshot and gradebook
+        with ThreadPoolExecutor(max_workers=len(surveys)) as pool:
+            futures = {survey: pool.submit(getattr(self, SURVEYS[survey][1])) for survey in surveys}
+            for survey, future in futures.items():
+                self.gradebooks[survey] = future.result()
+        graded = time.perf_counter()
+
+        scores = {survey: {student: grade[0] for student, grade in self.gradebooks[survey].items()} for survey in surveys}
+        self.gradebook = pd.DataFrame(scores, columns=surveys).sort_index()
+        self.gradebook.index.name = 'student'
+        self.gradebook['total'] = self.gradebook[surveys].sum(axis=1, min_count=1)
+
+        print(f'graded {len(surveys)} surveys for {len(self.gradebook)} students: fetch {fetched - start:.2f}s, grade {graded - fetched:.2f}s')
+        return self.gradebook
+
+    def export_tables(self, semester: str, surveys: list[str] | None = None) -> dict[str, pd.DataFrame]:
+        #per-response, per-student and per-group score tables for the surveys graded by grade_all
+        if self.incremental:
+            raise ValueError('export needs every response, run it without --incremental')
+        if not self.keep_tables:
+            raise ValueError('export needs the response tables, create the Grader with keep_tables=True')
+        surveys = list(surveys or self.gradebooks)
+
+        #sections and groups come from the class list when it is available, the proposal survey also records groups itself
+        sections, groups = {}, {}
+        if os.path.exists(".streamlit/secrets.toml"):
+            roster = Roster.from_secrets(toml.load(".streamlit/secrets.toml")['class_list']['students'])
+            sections = {student.name: student.section for student in roster}
+            groups = {student.name: student.group for student in roster}
+
+        responses, students, group_tables = [], [], []
+        for survey in surveys:
+            node, method, points = SURVEYS[survey]
+            snapshot = self.snapshots[node]
+            survey_groups = dict(groups)
+            survey_groups.update(snapshot.last_values.get('group_being_scored', {}))
+            if survey in GROUP_SURVEYS:
+                survey_groups.update({group: group for group in snapshot.tallies[0].keys})
+
+            responses.append(export.response_rows(semester, survey, self.tables[node], snapshot.rubrics))
+            students.append(export.student_rows(semester, survey, self.gradebooks[survey], points, sections, survey_groups))
+            group_tables.append(export.group_rows(semester, survey, self.tables[node], snapshot.rubrics, survey_groups))
+
+        return {
+            "responses": pd.concat(responses, ignore_index=True),
+            "students": pd.concat(students, ignore_index=True),
+            "groups": pd.concat(group_tables, ignore_index=True),
+        }
+
+    def export(self, semester: str, out_dir: str | Path = export.EXPORT_DIR, formats: tuple[str, ...] = ("parquet", "csv"), surveys: list[str] | None = None) -> list[Path]:
+        #write the export tables to <out_dir>/<semester>/
+        tables = self.export_tables(semester, surveys)
+        written = export.write_tables(tables, semester, out_dir, formats)
+        for name, table in tables.items():
+            print(f'{name}: {len(table)} rows')
+        return written
+
+    def open_archive(self, path: str | Path = ARCHIVE_PATH) -> SemesterArchive:
+        if self.archive is None or self.archive.path != Path(path):
+            self.archive = SemesterArchive(path)
+        return self.archive
+
+    def archive_semester(self, semester: str, path: str | Path = ARCHIVE_PATH, surveys: list[str] | None = None):
+        #copy this semester's survey nodes, roster and graded tables into the archive before Firebase is cleared
+        #run grade_all first, the archived scores are the ones it produced
+        archive = self.open_archive(path)
+        surveys = list(surveys or self.gradebooks)
+        for node in [SURVEYS[survey][0] for survey in surveys] + ['Group_Creation']:
+            archive.archive_node(semester, node, self.store.get(node))
+
+        #the Canvas roster has ids and logins, the class list in secrets.toml is the fallback
+        #the cached one is only used when it was saved for the configured course within ROSTER_MAX_AGE
+        roster = None
+        if os.path.exists(".canvas/canvas_secrets.toml"):
+            course_id = int(toml.load(".canvas/canvas_secrets.toml")['canvas']['COURSE_ID'])
+            roster = Roster.load_cached(course_id, ROSTER_MAX_AGE)
+        if roster is None and os.path.exists(".streamlit/secrets.toml"):
+            roster = Roster.from_secrets(toml.load(".streamlit/secrets.toml")['class_list']['students'])
+        if roster is not None:
+            archive.archive_roster(semester, roster)
+
+        archive.archive_results(semester, self.export_tables(semester, surveys), roster)
+        print(f'archived {semester}: {len(surveys)} surveys, {len(roster) if roster else 0} students in {archive.path}')
+
+    def semester_stats(self, by: tuple[str, ...] = ("semester", "survey"), survey: str | None = None, semesters: list[str] | None = None, path: str | Path = ARCHIVE_PATH) -> pd.DataFrame:
+        #cross-semester score statistics from the archive, grouped by semester, survey, section and/or group_name
+        return self.open_archive(path).score_stats(by, survey, semesters)
 
     def grade_midterm_peer_evaluation(self,):
-        ref = db.reference('Midterm_Peer_Evaluations')
-        responses = ref.get()
-
-        for user, data in responses.items():
-            for key,response in data.items(): 
-                reviewee = response['student_being_reviewed']
-                if reviewee in self.student_responsebook.keys():
-                    self.student_responsebook[reviewee].append(response)
-                else:
-                    self.student_responsebook[reviewee] = [response]
-        
-        self.midterm_peer_eval_gradebook = {}
-
-        for student, responses in self.student_responsebook.items():
-            ind_scores = {
-                "labs": {"pts": 0, "total": 0},
-                "meetings_score": {"pts": 0, "total": 0},
-                "memos_score": {"pts": 0, "total": 0},
-                "final_project_score": {"pts": 0, "total": 0},
-                "comments": []
-            }
-
-            for response in responses:
-                for question, score_data in ind_scores.items():
-                    if question == "comments":
-                        if response.get("comments"):
-                            score_data.append(response["comments"])
-                    else:
-                        score = response.get(question)
-                        if score is not None:
-                            ind_scores[question]["pts"] += float(score)
-                            ind_scores[question]["total"] += 5
-
-            
-            
-            individual_score_normalized = sum(v["pts"] for v in ind_scores.values() if isinstance(v, dict)) / sum(v["total"] for v in ind_scores.values() if isinstance(v, dict))
-            
-            overall_score = (individual_score_normalized*10)
-
-
-            text_feedback = f"""
-            ---------------------------------------------------
-            {student}
-            ---------------------------------------------------
-            Standard Lab participation: {(ind_scores["labs"]["pts"] / ind_scores["labs"]["total"])*10:.2f} / 10
-            Contribution to group memos: {(ind_scores["memos_score"]["pts"] / ind_scores["memos_score"]["total"])*10:.2f} / 10
-            Participation in group discussions / meetings: {(ind_scores["meetings_score"]["pts"] / ind_scores["meetings_score"]["total"])*10:.2f} / 10
-            Work on final experiment: {(ind_scores["final_project_score"]["pts"] / ind_scores["final_project_score"]["total"])*10:.2f} / 10
-            
-            ---------------------------------------------------
-            Peer Evaluation Grade: {overall_score:.2f}/10 ----> {individual_score_normalized*100:.2f}%
-            ---------------------------------------------------
-            Comments: {"\n-" + "\n-".join(ind_scores["comments"])} 
+        survey, affected = self.load_survey('Midterm_Peer_Evaluations', 'student_being_reviewed', [MIDTERM_PEER_EVALUATION])
+        scores, = survey.tallies
+        individual_score_normalized = scores.normalized()
+        overall_scores = individual_score_normalized*10
+
+        #feedback is rendered for every affected student in one batch
+        rows = [i for i, student in enumerate(scores.keys) if student in affected]
+        text_feedback = [""] * len(rows)
+        if self.feedback:
+            columns = rubric_columns(scores, 10, rows)
+            columns.update({
+                'student': list(scores.keys[rows]),
+                'score': formatted(overall_scores[rows]),
+                'percent': formatted(individual_score_normalized[rows]*100),
+                'comments': [bullets(scores.comments_for(student)) for student in scores.keys[rows]],
+            })
+            text_feedback = render(MIDTERM_PEER_EVALUATION_FEEDBACK, columns)
+        text_feedback = dict(zip(scores.keys[rows], text_feedback))
 
+        self.midterm_peer_eval_gradebook = {}
 
-            """
+        for i, student in enumerate(scores.keys):
+            if student not in affected:
+                self.midterm_peer_eval_gradebook[student] = survey.gradebook[student]
+                continue
+            self.midterm_peer_eval_gradebook[student] = [float(overall_scores[i]),text_feedback[student]]
 
-            self.midterm_peer_eval_gradebook[student] = [overall_score,text_feedback]
+        self.save_snapshot('Midterm_Peer_Evaluations', self.midterm_peer_eval_gradebook)
         return self.midterm_peer_eval_gradebook
 
     def grade_final_peer_evaluation(self,):
-        ref = db.reference('Final_Peer_Evaluations')
-        responses = ref.get()
+        survey, affected = self.load_survey('Final_Peer_Evaluations', 'student_being_reviewed', [FINAL_PEER_EVALUATION], skip_keys=('me4842_comments',))
+        scores, = survey.tallies
+        individual_score_normalized = scores.normalized()
+        overall_scores = individual_score_normalized*10
 
         self.course_feedback = []
 
-        for user, data in responses.items():
-            for key,response in data.items(): 
-                if key =='me4842_comments':
-                    for comment in data['me4842_comments'].values():
-                        if comment.strip():
-                            self.course_feedback.append(comment)
-                else:
-                    reviewee = response['student_being_reviewed']
-                    if reviewee in self.student_responsebook.keys():
-                        self.student_responsebook[reviewee].append(response)
-                    else:
-                        self.student_responsebook[reviewee] = [response]
-        
-        self.final_peer_eval_gradebook = {}
-
-        for student, responses in self.student_responsebook.items():
-            ind_scores = {
-                "labs_and_memos": {"pts": 0, "total": 0},
-                "meetings_score": {"pts": 0, "total": 0},
-                "final_project_score": {"pts": 0, "total": 0},
-                "comments": []
-            }
-
-            for response in responses:
-                for question, score_data in ind_scores.items():
-                    if question == "comments":
-                        if response.get("comments"):
-                            score_data.append(response["comments"])
-                    else:
-                        score = response.get(question)
-                        if score is not None:
-                            ind_scores[question]["pts"] += float(score)
-                            ind_scores[question]["total"] += 5
-
-            
-            
-            individual_score_normalized = sum(v["pts"] for v in ind_scores.values() if isinstance(v, dict)) / sum(v["total"] for v in ind_scores.values() if isinstance(v, dict))
-            
-            overall_score = (individual_score_normalized*10)
-
+        for user, comments in survey.data.get('me4842_comments', {}).items():
+            for comment in comments.values():
+                if comment.strip():
+                    self.course_feedback.append(comment)
+
+        rows = [i for i, student in enumerate(scores.keys) if student in affected]
+        text_feedback = [""] * len(rows)
+        if self.feedback:
+            columns = rubric_columns(scores, 10, rows)
+            columns.update({
+                'student': list(scores.keys[rows]),
+                'score': formatted(overall_scores[rows]),
+                'percent': formatted(individual_score_normalized[rows]*100),
+                'comments': [bullets(scores.comments_for(student)) for student in scores.keys[rows]],
+            })
+            text_feedback = render(FINAL_PEER_EVALUATION_FEEDBACK, columns)
+            write_course_feedback(self.course_feedback)
+        text_feedback = dict(zip(scores.keys[rows], text_feedback))
 
-            text_feedback = f"""
-            ---------------------------------------------------
-            {student}
-            ---------------------------------------------------
-            Standard Lab participation: {(ind_scores["labs_and_memos"]["pts"] / ind_scores["labs_and_memos"]["total"])*10:.2f} / 10
-            Participation during group meetings: {(ind_scores["meetings_score"]["pts"] / ind_scores["meetings_score"]["total"])*10:.2f} / 10
-            Work on final experiment: {(ind_scores["final_project_score"]["pts"] / ind_scores["final_project_score"]["total"])*10:.2f} / 10
-            ---------------------------------------------------
-            Peer Evaluation Grade: {overall_score:.2f}/10 ----> {individual_score_normalized*100:.2f}%
-            ---------------------------------------------------
-            Comments: {"\n-" + "\n-".join(ind_scores["comments"])} 
-
-
-            """
+        self.final_peer_eval_gradebook = {}
 
-            self.final_peer_eval_gradebook[student] = [overall_score,text_feedback]
-            
-            sep = "\n" + "=" * 80 + "\n"
-            with open("me4842_feedback.txt", "w", encoding="utf-8") as f:
-                for i, response in enumerate(self.course_feedback, start=1):
-                    f.write(f"Response {i}\n")
-                    f.write(response.rstrip())
-                    f.write(sep)
+        for i, student in enumerate(scores.keys):
+            if student not in affected:
+                self.final_peer_eval_gradebook[student] = survey.gradebook[student]
+                continue
+            self.final_peer_eval_gradebook[student] = [float(overall_scores[i]),text_feedback[student]]
 
+        self.save_snapshot('Final_Peer_Evaluations', self.final_peer_eval_gradebook)
         return self.final_peer_eval_gradebook
 
 
     def grade_symposium(self):
-        ref = db.reference('Poster_Symposium_Evaluation')
-        responses = ref.get()
+        survey, affected = self.load_survey('Poster_Symposium_Evaluation', 'group', [SYMPOSIUM])
+        scores, = survey.tallies
+        group_score_normalized = scores.normalized()
+
+        rows = [i for i, group in enumerate(scores.keys) if group in affected]
+        text_feedback = [""] * len(rows)
+        if self.feedback:
+            columns = rubric_columns(scores, 100, rows)
+            columns.update({
+                'group': list(scores.keys[rows]),
+                'percent': formatted(group_score_normalized[rows]*100),
+                'score': formatted(group_score_normalized[rows]*50),
+                'comments': [bullets(scores.comments_for(group)) for group in scores.keys[rows]],
+            })
+            text_feedback = render(SYMPOSIUM_FEEDBACK, columns)
+        text_feedback = dict(zip(scores.keys[rows], text_feedback))
 
         self.symposium_group_gradebook = {}
         self.symposium_student_gradebook = {}
 
-        for user, data in responses.items():
-            for key,response in data.items():
-                group_being_reviewed = response['group']
-                if group_being_reviewed in self.student_responsebook.keys():
-                    self.student_responsebook[group_being_reviewed].append(response)
-                else:
-                    self.student_responsebook[group_being_reviewed] = [response]
-
-        for group, group_responses in self.student_responsebook.items():
-            group_scores = {
-            "answering_questions": {"pts": 0, "total": 0},
-            "technical_content": {"pts": 0, "total": 0},
-            "completeness": {"pts": 0, "total": 0},
-            "presentation_quality": {"pts": 0, "total": 0},
-            "feedback": []
-            }
-
-            for response in group_responses:
-                for question, score_data in group_scores.items():
-                    if question == "feedback":
-                        if response.get("feedback"):
-                            score_data.append(response["feedback"])
-                    else:
-                        score = response.get(question)
-                        if score is not None:
-                            if int(score) != 0:
-                                group_scores[question]["pts"] += float(score) 
-                                group_scores[question]["total"] += 100
-
-            group_score_normalized = sum(v["pts"] for v in group_scores.values() if isinstance(v, dict)) / sum(v["total"] for v in group_scores.values() if isinstance(v, dict))
-            text_feedback = f"""
-
-            ---------------------------------------------------
-            Poster Symposium Score: {group}
-            ---------------------------------------------------
-            Technical Content: {(group_scores["technical_content"]["pts"] / group_scores["technical_content"]["total"] * 100):.2f}%
-            Presentation Completeness: {(group_scores["completeness"]["pts"] / group_scores["completeness"]["total"] * 100):.2f}%
-            Presentation Quality: {(group_scores["presentation_quality"]["pts"] / group_scores["presentation_quality"]["total"] * 100):.2f}%
-            Ability to Answer Questions: {(group_scores["answering_questions"]["pts"] / group_scores["answering_questions"]["total"] * 100):.2f}%
-            
-            Group Score: {group_score_normalized*100:.2f}%
-            Group Points: {group_score_normalized*50:.2f} / 50
+        for i, group in enumerate(scores.keys):
+            if group not in affected:
+                self.symposium_group_gradebook[group] = survey.gradebook[group]
+                continue
+            self.symposium_group_gradebook[group] = [float(group_score_normalized[i]*50),text_feedback[group]]
 
-            Inidvidual Feedback Recieved: {"\n-" + "\n-".join(group_scores["feedback"])} 
-            """
-            
-            self.symposium_group_gradebook[group] = [group_score_normalized*50,text_feedback]
+        self.save_snapshot('Poster_Symposium_Evaluation', self.symposium_group_gradebook)
 
         secrets = toml.load(".streamlit/secrets.toml")
-        students = secrets['class_list']['students']
+        roster = Roster.from_secrets(secrets['class_list']['students'])
 
-        for student in students:
-            section,group,name,userid = student.split(',')
-            self.symposium_student_gradebook[name] = self.symposium_group_gradebook[group]
-            print(self.symposium_student_gradebook[name][1])
+        for student in roster:
+            self.symposium_student_gradebook[student.name] = self.symposium_group_gradebook[student.group]
+            if self.feedback:
+                print(self.symposium_student_gradebook[student.name][1])
 
         return self.symposium_student_gradebook
 
 
     def grade_prop(self):
-        #write response to Proposal database
+        #responses are scored a chunk at a time with grouped reductions
         database = 'Proposal_Responses'
-        ref = db.reference(database)
-        responses = ref.get() or {}
-
-        for reviewer, reviewer_responses in responses.items():
-            if not isinstance(reviewer_responses, dict):
-                continue
-
-            for key, response in reviewer_responses.items():  # response is the dict directly
-                reviewee = response['student_being_reviewed']
-                if isinstance(reviewee, list):
-                    for student in reviewee:
-                        if student in self.student_responsebook:
-                            self.student_responsebook[student].append(response)
-                        else:
-                            self.student_responsebook[student] = [response]
-                else:
-                    if reviewee in self.student_responsebook:
-                        self.student_responsebook[reviewee].append(response)
-                    else:
-                        self.student_responsebook[reviewee] = [response]
-
-        rating_map = {"Substandard": 2,"Poor": 2.75,"Acceptable": 3.5,"Good": 4.25,"Excellent": 5}
+        survey, affected = self.load_survey(database, 'student_being_reviewed', [PROPOSAL_INDIVIDUAL, PROPOSAL_GROUP], extra=['group_being_scored'])
+
+        #students keep the order they were first reviewed in
+        ind_scores, group_scores = survey.tallies
+        students = ind_scores.keys
+        group_names = survey.last_values['group_being_scored']
+
+        individual_score_normalized = ind_scores.normalized()
+        group_score_normalized = group_scores.normalized()
+        overall_scores = (individual_score_normalized*25) + (group_score_normalized *10)
+
+        rows = [i for i, student in enumerate(students) if student in affected]
+        text_feedback = [""] * len(rows)
+        if self.feedback:
+            columns = rubric_columns(ind_scores, 100, rows)
+            columns.update(rubric_columns(group_scores, 100, rows))
+            columns.update({
+                'student': list(students[rows]),
+                'group': [str(group_names.get(student)) for student in students[rows]],
+                'individual_percent': formatted(individual_score_normalized[rows]*100),
+                'individual_points': formatted(individual_score_normalized[rows]*25),
+                'group_percent': formatted(group_score_normalized[rows]*100),
+                'group_points': formatted(group_score_normalized[rows]*10),
+                'score': formatted(overall_scores[rows]),
+                'percent': formatted(overall_scores[rows]*100/35),
+                'individual_comments': [bullets(ind_scores.comments_for(student)) for student in students[rows]],
+                'group_comments': [bullets(group_scores.comments_for(student)) for student in students[rows]],
+            })
+            text_feedback = render(PROPOSAL_FEEDBACK, columns)
+        text_feedback = dict(zip(students[rows], text_feedback))
 
         #structured [[student name, grade, comments]]
         self.proposal_gradebook = {}
 
-        for student,responses in self.student_responsebook.items():
-
-            ind_scores = {
-                "dress_code_score": {"pts": 0, "total": 0},
-                "audience_engagement_score": {"pts": 0, "total": 0},
-                "body_language_score": {"pts": 0, "total": 0},
-                "enthusiasm_score": {"pts": 0, "total": 0},
-                "overall_score": {"pts": 0, "total": 0},
-                "written_feedback": []
-            }
-            group_scores = {
-                "technical_content_score": {"pts": 0, "total": 0},
-                "experimental_efficacy_score": {"pts": 0, "total": 0},
-                "completeness_score": {"pts": 0, "total": 0},
-                "presentation_quality_score": {"pts": 0, "total": 0},
-                "answering_questions_score": {"pts": 0, "total": 0},
-                "written_feedback": []
-            }
-            
-            for response in responses:
-                response_type = response['response_type']
-                weight = response['scoring_weight']
-                if response_type == 'Individual':
-                    for question, score_data in ind_scores.items():
-                        if question == "written_feedback":
-                            if response.get("written_feedback"):
-                                score_data.append(response["written_feedback"])
-                        else:
-                            label = response.get(question)
-                            if label is not None:
-                                numeric_score = rating_map[label]
-                                ind_scores[question]["pts"] += float(numeric_score) * weight
-                                ind_scores[question]["total"] += weight * 5
-                                if numeric_score == 1:
-                                    print('found bad score')
-
-                elif response_type == 'Group':
-                    group_name = response['group_being_scored']
-                    for question, score_data in group_scores.items():
-                        if question == "written_feedback":
-                            if response.get("written_feedback"):
-                                score_data.append(response["written_feedback"])
-                        else:
-                            score = response.get(question)
-                            if score is not None:
-                                if int(score) != 0:
-                                    group_scores[question]["pts"] += float(score) * weight
-                                    group_scores[question]["total"] += weight * 10
-
-        
-            individual_score_normalized = sum(v["pts"] for v in ind_scores.values() if isinstance(v, dict)) / sum(v["total"] for v in ind_scores.values() if isinstance(v, dict))
-            group_score_normalized = sum(v["pts"] for v in group_scores.values() if isinstance(v, dict)) / sum(v["total"] for v in group_scores.values() if isinstance(v, dict))
-            overall_score = (individual_score_normalized*25) + (group_score_normalized *10)
-
-
-            text_feedback = f"""
-            ---------------------------------------------------
-            Individual Scores: {student}
-            ---------------------------------------------------
-            Dress Code: {(ind_scores["dress_code_score"]["pts"] / ind_scores["dress_code_score"]["total"] * 100):.2f}%
-            Audience Engagement: {(ind_scores["audience_engagement_score"]["pts"] / ind_scores["audience_engagement_score"]["total"] * 100):.2f}%
-            Body Language: {(ind_scores["body_language_score"]["pts"] / ind_scores["body_language_score"]["total"] * 100):.2f}%
-            Enthusiasm: {(ind_scores["enthusiasm_score"]["pts"] / ind_scores["enthusiasm_score"]["total"] * 100):.2f}%
-            Speaking: {(ind_scores["overall_score"]["pts"] / ind_scores["overall_score"]["total"] * 100):.2f}%
-            
-            Individual Score: {individual_score_normalized*100:.2f}%
-            Individual Points: {individual_score_normalized*25:.2f} / 25
-
-            Inidvidual Feedback Recieved: {"\n-" + "\n-".join(ind_scores["written_feedback"])} 
-            ---------------------------------------------------
-            Group Scores: {group_name}
-            ---------------------------------------------------
-            Technical: {(group_scores["technical_content_score"]["pts"] / group_scores["technical_content_score"]["total"] * 100):.2f}%
-            Efficacy: {(group_scores["experimental_efficacy_score"]["pts"] / group_scores["experimental_efficacy_score"]["total"] * 100):.2f}%
-            Completeness: {(group_scores["completeness_score"]["pts"] / group_scores["completeness_score"]["total"] * 100):.2f}%
-            Presentation Quality: {(group_scores["presentation_quality_score"]["pts"] / group_scores["presentation_quality_score"]["total"] * 100):.2f}%
-            Ability to Answer Questions: {(group_scores["answering_questions_score"]["pts"] / group_scores["answering_questions_score"]["total"] * 100):.2f}%
-            
-            Group Score: {group_score_normalized*100:.2f}%
-            Group Points: {group_score_normalized*10:.2f} / 10
-            
-            Group Feedback Recieved: {"\n-" +"\n-".join(group_scores["written_feedback"])}
-            ---------------------------------------------------
-            Final Assignment Grade
-            ---------------------------------------------------
-            Group Score + Individual Score = Overall Score
-            
-            {individual_score_normalized*25:.2f} + {group_score_normalized*10:.2f}  = {overall_score:.2f}/35 ----> {overall_score*100/35:.2f}%\n
-
-            """
+        for i, student in enumerate(students):
+            if student not in affected:
+                self.proposal_gradebook[student] = survey.gradebook[student]
+                continue
+            self.proposal_gradebook[student] = [float(overall_scores[i]),text_feedback[student]]
 
-            self.proposal_gradebook[student] = [overall_score,text_feedback]
+        self.save_snapshot(database, self.proposal_gradebook)
         return self.proposal_gradebook
 
 
@@ -365,8 +374,7 @@ class Grader:
         grouped_students = []
         
 
-        ref = db.reference('Group_Creation')
-        responses = ref.get()
+        responses = self.store.get('Group_Creation')
 
 
         for user, response in responses.items():
@@ -396,30 +404,24 @@ class Grader:
                 students = student_groups[section][group]['Group Members']
                 student_counts.update(students)
 
-        canvas_student_roster = []
-        for entry in st.secrets["class_list"]["students"]:
-            sec, grp, nm, email = entry.split(",")
-            sec, grp, nm, email = sec.strip(), grp.strip(), nm.strip(),email.strip()
-            canvas_student_roster.append((nm,sec))
+        roster = Roster.from_secrets(st.secrets["class_list"]["students"])
 
         not_in_groups = []
         in_multiple_groups = []
 
         # Find students not assigned.
-        for student,section in canvas_student_roster:
-            if student not in student_counts.keys():
-                #print(student + " is not in a group.")
-
-                not_in_groups.append((section,student))
+        for student in roster:
+            if student.name not in student_counts:
+                not_in_groups.append((student.section,student.name))
         
         # Find students in multiple groups.
         for student in student_counts:
             if student_counts[student] > 1:
 
-                match = next((t for t in canvas_student_roster if t[0] == student), None)
+                match = roster.get(student)
                 print(match)
 
-                in_multiple_groups.append((match[1],match[0]))
+                in_multiple_groups.append((match.section,match.name))
         
         if os.path.exists('groups.yml'):
             user_data = input('A groups.yml file already exists. Overwrite? (Y/N)\n').strip().lower()
@@ -431,10 +433,12 @@ class Grader:
         return
 
 
-    def assign_labs(self,):
-        # Run picker
+    def assign_labs(self, stations: int | None = None, weeks: int = 2, workers: int | None = None, combined: bool = False):
+        # Run picker, stations is per elective per week, by default just enough to seat the whole section
+        # sections are solved side by side in a process pool, combined writes one workbook instead of one per section
+        # the workers run stutts_picker.solve_section, but where processes are spawned (Windows, macOS) each one
+        # still re-imports grader.py and its dependencies before it starts
 
-        pref_responses = {}
         if os.path.isdir('lab_assignments'):
             is_empty = not any(Path('lab_assignments').iterdir())
             if not is_empty:
@@ -460,26 +464,31 @@ class Grader:
                 sections_data_yaml[section] = {}
                 sections_data_yaml[section][group_name] = group[group_name]['Labs']
 
-        
+        section_inputs = {}
         for section_name, data in sections_data_yaml.items():
-            group_data = []
-            for group_name, labs in data.items():
-                print(labs)
-                group_data.append({
-                    "Group": group_name,
-                    "Electives": labs
-                })
+            section_inputs[section_name] = [{"Group": group_name, "Electives": labs} for group_name, labs in data.items()]
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                section_name: pool.submit(picker.solve_section, group_data, picker.ELECTIVES, stations, weeks, 5, 1, None if combined else f"lab_assignments/{section_name}.xlsx")
+                for section_name, group_data in section_inputs.items()
+            }
+            sections = {section_name: future.result() for section_name, future in futures.items()}
 
-            groups, costs, ranks = picker.process_input_and_build_costs(group_data, ['Acoustics', 'Pump', 'Tuned Mass Damper', 'Dynamic Balancing', 'Piezoelectric'], unlisted_penalty=5, seed=1)
+        for section_name, section in sections.items():
+            total_cost = section["result"]["total_cost"] if section["result"] else None
+            print(json.dumps({"section": section_name, "status": section["status"], "total_cost": total_cost, "groups": len(section["groups"]),
+                              "solve_s": round(section["solve_time"], 3), "write_s": round(section["write_time"], 3)}))
 
-            if len(groups) > 5:
-                raise SystemExit(f"Infeasible: {len(groups)} groups but only 5 one-station electives per week. Split the section or add capacity.")
-            result, status = picker.solve_ilp(groups, costs, T=2)
-            if status != "ok":
-                result, status = picker.solve_greedy(groups, costs, T=2)
+        #feasible sections are written either way, the combined Overview lists the infeasible ones too
+        if combined:
+            picker.write_combined_output("lab_assignments/lab_assignments.xlsx", sections, 1, 5, T=weeks)
+        infeasible = [f'{name} ({len(s["groups"])} groups, {s["stations"]} station(s) per elective)' for name, s in sections.items() if s["result"] is None]
+        print(f'scheduled {len(sections) - len(infeasible)} of {len(sections)} sections in {time.perf_counter() - start:.2f} seconds')
 
-            picker.write_output(f"lab_assignments/{section_name}.xlsx", result, groups, costs, ranks, None, 5, T=2)
-            print(json.dumps({"status": status, "total_cost": result["total_cost"], "groups": len(groups)}))
+        if infeasible:
+            raise SystemExit(f'no lab schedule over {weeks} weeks for: {", ".join(infeasible)}')
 
 
     def export_groups(self, student_groups: dict[str, dict[str, list[str]]], students_not_in_groups: list[tuple[str, str]], students_in_multiple_groups: list[str]):
@@ -513,27 +522,128 @@ def main():
 
     parser.add_argument(
         "command",
-        choices=["groups_yml", 'optimize_labs','grade_proposal'],
+        choices=["groups_yml", 'optimize_labs','grade_proposal','grade_all','export','archive','history'],
         help="Class Grading and organization Functions"
     )
 
-    # parser.add_argument(
-    #     "--value",
-    #     type=int,
-    #     default=0,
-    #     help="Optional value for run()"
-    # )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Grade from the local Firebase cache only (.cache/firebase), never contact the database"
+    )
+
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_TTL,
+        help=f"Seconds a cached Firebase node is reused before it is fetched again (default: {DEFAULT_TTL})"
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Fetch large survey nodes this many reviewers at a time instead of in one request"
+    )
+
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only fetch and score responses submitted since the last run (snapshot in .cache/incremental)"
+    )
+
+    parser.add_argument(
+        "--surveys",
+        nargs="+",
+        choices=list(SURVEYS),
+        default=None,
+        help="grade_all: surveys to grade (default: all of them)"
+    )
+
+    parser.add_argument(
+        "--output",
+        default="gradebook.csv",
+        help="grade_all: csv file for the combined gradebook"
+    )
+
+    parser.add_argument(
+        "--semester",
+        default=export.current_semester(),
+        help=f"export/archive: semester label for the exported or archived tables (default: {export.current_semester()})"
+    )
+
+    parser.add_argument(
+        "--export-dir",
+        default=str(export.EXPORT_DIR),
+        help="export: folder that holds one subfolder of tables per semester"
+    )
+
+    parser.add_argument(
+        "--archive",
+        default=str(ARCHIVE_PATH),
+        help="archive/history: sqlite file holding every archived semester"
+    )
+
+    parser.add_argument(
+        "--by",
+        nargs="+",
+        choices=["semester", "survey", "section", "group_name"],
+        default=["semester", "survey"],
+        help="history: columns to group the score statistics by"
+    )
+
+    parser.add_argument(
+        "--format",
+        nargs="+",
+        choices=["parquet", "csv"],
+        default=["parquet", "csv"],
+        help="export: file formats to write"
+    )
+
+    parser.add_argument(
+        "--stations",
+        type=int,
+        default=None,
+        help="optimize_labs: stations per elective per week (default: just enough for each section)"
+    )
+
+    parser.add_argument(
+        "--weeks",
+        type=int,
+        default=2,
+        help="optimize_labs: elective weeks after Heat Transfer (default: 2)"
+    )
+
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="optimize_labs: processes solving sections at once (default: one per CPU)"
+    )
+
+    parser.add_argument(
+        "--combined",
+        action="store_true",
+        help="optimize_labs: write every section into lab_assignments/lab_assignments.xlsx instead of one workbook each"
+    )
+
+    parser.add_argument(
+        "--no-feedback",
+        action="store_true",
+        help="Only compute scores, skip rendering text feedback and me4842_feedback.txt"
+    )
 
     args = parser.parse_args()
 
-    grader = Grader()
+    grader = Grader(incremental=args.incremental, offline=args.offline, cache_ttl=args.cache_ttl, chunk_size=args.chunk_size, feedback=not args.no_feedback,
+                    keep_tables=args.command in ('export', 'archive'))
 
     # ---- Dispatch ----
     if args.command == "groups_yml":
         grader.create_groups()
 
     if args.command == 'optimize_labs':
-        grader.assign_labs()
+        grader.assign_labs(stations=args.stations, weeks=args.weeks, workers=args.workers, combined=args.combined)
     
     if args.command == 'grade_proposal':
         gradebook = grader.grade_prop()
@@ -541,6 +651,29 @@ def main():
             print(grades[0])
             print(grades[1])
 
+    if args.command == 'grade_all':
+        gradebook = grader.grade_all(args.surveys)
+        gradebook.to_csv(args.output)
+        print(gradebook.to_string(float_format='{:.2f}'.format))
+        print(f'combined gradebook written to {args.output}')
+
+    if args.command == 'export':
+        grader.feedback = False
+        grader.grade_all(args.surveys)
+        for path in grader.export(args.semester, args.export_dir, tuple(args.format)):
+            print(f'wrote {path}')
+
+    if args.command == 'archive':
+        grader.feedback = False
+        grader.grade_all(args.surveys)
+        grader.archive_semester(args.semester, args.archive)
+
+    if args.command == 'history':
+        survey = args.surveys[0] if args.surveys and len(args.surveys) == 1 else None
+        print(grader.semester_stats(tuple(args.by), survey, path=args.archive).to_string(float_format='{:.2f}'.format))
+
+    print(grader.store.stats())
+
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
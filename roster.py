@@ -0,0 +1,292 @@
+import csv
+import json
+import re
+import time
+import unicodedata
+from difflib import SequenceMatcher
+from pathlib import Path
+
+
+#resolved Canvas roster is kept here between runs, written by CanvasTool.save_roster
+ROSTER_CACHE = Path(".cache") / "roster.json"
+#a cached roster older than this is crawled again even if nothing looks different
+ROSTER_MAX_AGE = 7 * 24 * 3600
+
+#fuzzy name matches scoring below this are reported instead of accepted
+MATCH_CUTOFF = 0.85
+#a fuzzy match must beat the runner up by this much, otherwise it is ambiguous
+MATCH_MARGIN = 0.05
+
+
+def read_roster_cache(course_id: int, max_age: float = ROSTER_MAX_AGE, path: str | Path = ROSTER_CACHE) -> dict | None:
+    #the raw cache written by CanvasTool.save_roster if it belongs to course_id and is recent enough
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        cached = json.load(f)
+
+    #caches written before the Roster records are simply rebuilt
+    if "students" not in cached:
+        return None
+    if cached.get("course_id") != course_id:
+        print(f'cached roster is for course {cached.get("course_id")}, not {course_id}, ignoring it')
+        return None
+    if time.time() - cached["saved_at"] > max_age:
+        print('cached roster is too old, ignoring it')
+        return None
+    return cached
+
+
+def normalize_name(name: str) -> str:
+    #lowercase, strip accents and punctuation, "Last, First" becomes "first last"
+    name = unicodedata.normalize("NFKD", str(name))
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    if name.count(",") == 1:
+        last, first = name.split(",")
+        name = f"{first} {last}"
+    name = re.sub(r"[-._]", " ", name.lower())
+    name = re.sub(r"[^\w\s]", "", name)
+    return " ".join(name.split())
+
+
+def name_keys(normalized: str) -> tuple[set[str], set[str]]:
+    #blocking keys, whole name tokens first, then their first three letters so a typo in every token still shares a block
+    tokens = set(normalized.split())
+    return tokens, {token[:3] + "*" for token in tokens}
+
+
+def name_similarity(a: str, b: str, cutoff: float = 0.0) -> float:
+    #similarity of two normalized names, ignoring token order and a dropped middle name
+    #pairs that cannot reach cutoff return 0.0 without the full comparison, only use a cutoff to search, never to report
+    a_tokens, b_tokens = set(a.split()), set(b.split())
+    if len(a_tokens) > 1 and len(b_tokens) > 1 and (a_tokens <= b_tokens or b_tokens <= a_tokens):
+        return 0.95
+    matcher = SequenceMatcher(None, a, b)
+    #quick_ratio only counts shared characters, an upper bound for both orderings compared below
+    if matcher.real_quick_ratio() < cutoff or matcher.quick_ratio() < cutoff:
+        return 0.0
+    ratio = matcher.ratio()
+    sorted_ratio = SequenceMatcher(None, " ".join(sorted(a_tokens)), " ".join(sorted(b_tokens))).ratio()
+    return max(ratio, sorted_ratio)
+
+
+def closest_names(key: str, students, keys: dict[str, str], count: int = 3) -> list:
+    #real scores of the few students most likely to be closest, for reporting a name that did not match
+    likely = sorted(students, key=lambda student: -SequenceMatcher(None, key, keys[student.name]).quick_ratio())[:count * 2]
+    return sorted(((student, name_similarity(key, keys[student.name])) for student in likely), key=lambda pair: -pair[1])[:count]
+
+
+#RESULT OF JOINING AN OUTSIDE NAME TO THE ROSTER
+class NameMatch:
+    # How one outside name (e.g. a Firebase reviewee) was joined to the roster
+    __slots__ = ("name", "student", "score", "method", "candidates")
+
+    def __init__(self, name: str, student, score: float, method: str, candidates: list | None = None):
+        self.name = name
+        #matched Student, None when unmatched or ambiguous
+        self.student = student
+        self.score = score
+        #exact, normalized, fuzzy, ambiguous or unmatched
+        self.method = method
+        #[(Student, score)] best first, kept for the report
+        self.candidates = candidates or []
+
+
+def print_match_report(matches: list[NameMatch], path: str | None = None):
+    #list every join that was not exact so a person can check it, optionally write all of them to a csv
+    counts = {}
+    for match in matches:
+        counts[match.method] = counts.get(match.method, 0) + 1
+    print('name matches: ' + ', '.join(f'{count} {method}' for method, count in counts.items()))
+
+    for match in matches:
+        if match.method in ('exact', 'normalized'):
+            continue
+        others = ', '.join(f'{student.name} ({score:.2f})' for student, score in match.candidates[:3])
+        if match.student is not None:
+            print(f'  {match.method}: {match.name} -> {match.student.name} ({match.score:.2f})')
+        else:
+            print(f'  {match.method}: {match.name}' + (f', closest: {others}' if others else ''))
+
+    if path:
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["name", "method", "score", "student", "canvas_id", "section", "candidates"])
+            for match in matches:
+                student = match.student
+                writer.writerow([
+                    match.name, match.method, f'{match.score:.3f}',
+                    student.name if student else "", student.id if student else "", student.section if student else "",
+                    "; ".join(f'{s.name} ({score:.2f})' for s, score in match.candidates[:3]),
+                ])
+        print(f'match report written to {path}')
+
+
+#ROSTER SHARED BY CANVAS_TOOLS, THE GRADER AND THE STREAMLIT SURVEYS
+class Student:
+    # One enrolled student, slotted so a whole course stays small
+    __slots__ = ("id", "name", "section", "group", "login")
+
+    def __init__(self, name: str, section: str | None = None, group: str | None = None, login: str | None = None, id: int | None = None):
+        #canvas user id, None when the roster comes from the survey secrets
+        self.id = id
+        self.name = name
+        self.section = section
+        self.group = group
+        #login id without the email domain, this is what Google sign in reports to the surveys
+        self.login = login
+
+    def to_list(self) -> list:
+        return [self.id, self.name, self.section, self.group, self.login]
+
+    def __repr__(self):
+        return f'Student({self.name!r}, section={self.section!r}, group={self.group!r}, login={self.login!r}, id={self.id!r})'
+
+
+class Roster:
+    # Students in course order with hash indexes, joins are dict lookups instead of scans
+    def __init__(self, students=()):
+        self.students = []
+        self.by_id = {}
+        self.by_login = {}
+        self.by_name = {}
+        #{section: [Student]} and {group: [Student]}, both in course order
+        self.by_section = {}
+        self.by_group = {}
+        for student in students:
+            self.add(student)
+
+    def __len__(self):
+        return len(self.students)
+
+    def __iter__(self):
+        return iter(self.students)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.by_name
+
+    def get(self, name: str) -> Student | None:
+        return self.by_name.get(name)
+
+    def add(self, student: Student):
+        #a second record for the same canvas user (e.g. two section enrollments) replaces the first
+        if student.id is not None and student.id in self.by_id:
+            self.remove(self.by_id[student.id])
+        self.students.append(student)
+        if student.id is not None:
+            self.by_id[student.id] = student
+        if student.login:
+            self.by_login[student.login] = student
+        self.by_name[student.name] = student
+        self.by_section.setdefault(student.section, []).append(student)
+        self.by_group.setdefault(student.group, []).append(student)
+
+    def remove(self, student: Student):
+        self.students.remove(student)
+        self.by_id.pop(student.id, None)
+        self.by_login.pop(student.login, None)
+        self.by_name.pop(student.name, None)
+        self.by_section[student.section].remove(student)
+        self.by_group[student.group].remove(student)
+
+    def move(self, student: Student, group: str | None):
+        #change a student's group and keep the group index in step
+        self.by_group[student.group].remove(student)
+        student.group = group
+        self.by_group.setdefault(group, []).append(student)
+
+    def section_groups(self) -> dict[str, dict[str, list[str]]]:
+        #{section: {group: [names]}} in the order sections and groups first appear, as the survey dropdowns expect
+        nested = {}
+        for student in self.students:
+            nested.setdefault(student.section, {}).setdefault(student.group, []).append(student.name)
+        return nested
+
+    def section_students(self) -> dict[str, list[str]]:
+        #{section: [names]} listed group by group
+        return {section: [name for names in groups.values() for name in names] for section, groups in self.section_groups().items()}
+
+    @classmethod
+    def from_secrets(cls, entries: list[str]) -> "Roster":
+        #parse class_list.students from secrets.toml, each entry is "section,group,name,login or email"
+        roster = cls()
+        for entry in entries:
+            section, group, name, login = [part.strip() for part in entry.split(",", 3)]
+            roster.add(Student(name, section, group, login.split('@')[0]))
+        return roster
+
+    def to_records(self) -> list[list]:
+        return [student.to_list() for student in self.students]
+
+    @classmethod
+    def from_records(cls, records: list[list]) -> "Roster":
+        return cls(Student(name, section, group, login, id) for id, name, section, group, login in records)
+
+    @classmethod
+    def load_cached(cls, course_id: int, max_age: float = ROSTER_MAX_AGE, path: str | Path = ROSTER_CACHE) -> "Roster | None":
+        #the last Canvas roster CanvasTool saved for this course, None if it is missing, from another course or too old
+        cached = read_roster_cache(course_id, max_age, path)
+        return cls.from_records(cached["students"]) if cached is not None else None
+
+    def match(self, names, sections: dict[str, str] | None = None, cutoff: float = MATCH_CUTOFF) -> list[NameMatch]:
+        #join outside names to students: exact name, then normalized name, then fuzzy within a block
+        #sections {name: section} narrows the fuzzy candidates when the caller knows them
+        normalized = {}
+        keys = {}
+        blocks = {}
+        for student in self.students:
+            key = normalize_name(student.name)
+            keys[student.name] = key
+            normalized.setdefault(key, []).append(student)
+            for tier in name_keys(key):
+                for block in tier:
+                    blocks.setdefault(block, []).append(student)
+
+        matches = {}
+        claimed = set()
+        pending = []
+        for name in names:
+            student = self.by_name.get(name)
+            if student is None:
+                found = normalized.get(normalize_name(name), [])
+                if len(found) == 1:
+                    matches[name] = NameMatch(name, found[0], 1.0, 'normalized')
+                    claimed.add(found[0].name)
+                    continue
+                pending.append(name)
+                continue
+            matches[name] = NameMatch(name, student, 1.0, 'exact')
+            claimed.add(student.name)
+
+        #students already joined exactly are not offered to the fuzzy pass
+        for name in pending:
+            key = normalize_name(name)
+            section = (sections or {}).get(name)
+            scored = []
+            candidates = {}
+            #the wider prefix blocks are only searched when no whole-token neighbour is close enough
+            for tier in name_keys(key):
+                for block in tier:
+                    for student in blocks.get(block, []):
+                        if student.name in claimed or (section and student.section != section):
+                            continue
+                        candidates[student.name] = student
+                #runners up within the margin still get a real score, the ambiguity check below needs it
+                scored = sorted(((student, name_similarity(key, keys[student.name], cutoff - MATCH_MARGIN)) for student in candidates.values()), key=lambda pair: -pair[1])
+                if scored and scored[0][1] >= cutoff:
+                    break
+
+            if not scored or scored[0][1] < cutoff:
+                #candidates below the cutoff were skipped with a 0.0, rescore the closest ones so the report shows how near they came
+                if not candidates:
+                    candidates = {student.name: student for student in self.students if student.name not in claimed and not (section and student.section != section)}
+                scored = closest_names(key, candidates.values(), keys)
+                matches[name] = NameMatch(name, None, scored[0][1] if scored else 0.0, 'unmatched', scored)
+            elif len(scored) > 1 and scored[0][1] - scored[1][1] < MATCH_MARGIN:
+                matches[name] = NameMatch(name, None, scored[0][1], 'ambiguous', scored)
+            else:
+                matches[name] = NameMatch(name, scored[0][0], scored[0][1], 'fuzzy', scored)
+                claimed.add(scored[0][0].name)
+
+        return [matches[name] for name in names]
@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+
+
+#DECLARATIVE RUBRICS AND THE BATCHED SCORING ENGINE SHARED BY ALL GRADER SURVEYS
+class Rubric:
+    # One block of questions that are scored together, e.g. the individual half of the proposal survey
+    def __init__(self, fields: list[str], scale: float, weight: str | None = None, skip_zero: bool = False,
+                 comment: str | None = None, labels: dict[str, float] | None = None, response_type: str | None = None):
+        #survey question keys, in the order they are reported
+        self.fields = list(fields)
+        #points available per question per response
+        self.scale = scale
+        #response column holding the reviewer weight, None weighs every response the same
+        self.weight = weight
+        #a score of zero means the reviewer skipped the question (compared after int() truncation)
+        self.skip_zero = skip_zero
+        #response column holding free text feedback
+        self.comment = comment
+        #map from radio labels to numeric scores, None when the survey stores numbers
+        self.labels = labels
+        #only responses with this response_type are scored, None scores all of them
+        self.response_type = response_type
+
+
+class Tally:
+    # Point sums for one rubric, row i belongs to keys[i]
+    def __init__(self, rubric: Rubric, keys: pd.Index, pts: np.ndarray, total: np.ndarray, comments: dict[str, list[str]],
+                 comment_keys: dict[str, list[str]] | None = None):
+        self.rubric = rubric
+        self.keys = keys
+        #pts and total are shaped (len(keys), len(rubric.fields))
+        self.pts = pts
+        self.total = total
+        #comments are kept in push key order, comment_keys holds the push key of each one
+        self.comments = comments
+        self.comment_keys = comment_keys if comment_keys is not None else {key: [""] * len(values) for key, values in comments.items()}
+
+    def ratio(self, field: str) -> np.ndarray:
+        #fraction of available points earned on one question
+        j = self.rubric.fields.index(field)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.pts[:, j] / self.total[:, j]
+
+    def normalized(self) -> np.ndarray:
+        #fraction of available points earned over the whole rubric
+        #columns are added left to right so results match a per-response running sum
+        pts = sum(self.pts[:, j] for j in range(len(self.rubric.fields)))
+        total = sum(self.total[:, j] for j in range(len(self.rubric.fields)))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return pts / total
+
+    def comments_for(self, key: str) -> list[str]:
+        return self.comments.get(key, [])
+
+    def merge(self, other: "Tally") -> "Tally":
+        #add the sums from another tally of the same rubric, new keys are appended in order
+        keys = self.keys.append(other.keys[~other.keys.isin(self.keys)])
+        pts = np.zeros((len(keys), len(self.rubric.fields)))
+        total = np.zeros((len(keys), len(self.rubric.fields)))
+        pts[:len(self.keys)] = self.pts
+        total[:len(self.keys)] = self.total
+        idx = keys.get_indexer(other.keys)
+        pts[idx] += other.pts
+        total[idx] += other.total
+
+        #comments are merged by push key so an incremental run lists them as a full run would
+        comments = {key: list(values) for key, values in self.comments.items()}
+        comment_keys = {key: list(values) for key, values in self.comment_keys.items()}
+        for key, values in other.comments.items():
+            merged = sorted(zip(comment_keys.get(key, []) + other.comment_keys[key], comments.get(key, []) + values), key=lambda pair: pair[0])
+            comment_keys[key] = [push_key for push_key, _ in merged]
+            comments[key] = [comment for _, comment in merged]
+        return Tally(self.rubric, keys, pts, total, comments, comment_keys)
+
+    def to_dict(self) -> dict:
+        return {"keys": list(self.keys), "pts": self.pts.tolist(), "total": self.total.tolist(), "comments": self.comments,
+                "comment_keys": self.comment_keys}
+
+    @classmethod
+    def from_dict(cls, rubric: Rubric, data: dict) -> "Tally":
+        shape = (len(data["keys"]), len(rubric.fields))
+        pts = np.array(data["pts"], dtype=float).reshape(shape)
+        total = np.array(data["total"], dtype=float).reshape(shape)
+        #snapshots saved before comment_keys existed treat their comments as older than any new one
+        return cls(rubric, pd.Index(data["keys"], dtype=object), pts, total, data["comments"], data.get("comment_keys"))
+
+
+def build_table(responses: dict, key: str, rubrics: list[Rubric], extra: list[str] = (), skip_keys: tuple[str, ...] = ()) -> pd.DataFrame:
+    #flatten a survey node {reviewer: {push_key: response}} into one row per (response, reviewee)
+    #list valued keys (a whole group being reviewed) are repeated once per entry
+    columns = {name: [] for name in ["reviewer", "key", "reviewee", "response_type", "weight", *extra]}
+    converters = {}
+    comment_fields = []
+    for rubric in rubrics:
+        for field in rubric.fields:
+            converters[field] = rubric.labels
+        if rubric.comment and rubric.comment not in comment_fields:
+            comment_fields.append(rubric.comment)
+    weight_field = next((rubric.weight for rubric in rubrics if rubric.weight), None)
+    for name in [*comment_fields, *converters]:
+        columns[name] = []
+
+    for reviewer, reviewer_responses in responses.items():
+        if not isinstance(reviewer_responses, dict):
+            continue
+
+        for push_key, response in reviewer_responses.items():
+            if push_key in skip_keys or not isinstance(response, dict):
+                continue
+            reviewees = response[key]
+            if not isinstance(reviewees, list):
+                reviewees = [reviewees]
+
+            for reviewee in reviewees:
+                columns["reviewer"].append(reviewer)
+                columns["key"].append(push_key)
+                columns["reviewee"].append(reviewee)
+                columns["response_type"].append(response.get('response_type'))
+                columns["weight"].append(response[weight_field] if weight_field else 1)
+                for name in extra:
+                    columns[name].append(response.get(name))
+                for name in comment_fields:
+                    columns[name].append(response.get(name) or "")
+                for field, labels in converters.items():
+                    score = response.get(field)
+                    if labels is not None:
+                        columns[field].append(labels.get(score, np.nan))
+                    else:
+                        columns[field].append(np.nan if score is None else float(score))
+
+    table = pd.DataFrame(columns)
+    table["weight"] = table["weight"].astype(float)
+    for field in converters:
+        table[field] = table[field].astype(float)
+    return table
+
+
+def tally(table: pd.DataFrame, rubric: Rubric, keys: pd.Index | None = None) -> Tally:
+    #weighted per-reviewee sums for every rubric question in one grouped pass
+    if keys is None:
+        keys = pd.Index(pd.unique(table["reviewee"]))
+    codes = keys.get_indexer(table["reviewee"])
+    n = len(keys)
+
+    rows = codes >= 0
+    if rubric.response_type is not None:
+        rows &= (table["response_type"] == rubric.response_type).to_numpy()
+    weight = table["weight"].to_numpy()
+
+    pts = np.zeros((n, len(rubric.fields)))
+    total = np.zeros((n, len(rubric.fields)))
+    for j, field in enumerate(rubric.fields):
+        score = table[field].to_numpy()
+        mask = rows & ~np.isnan(score)
+        if rubric.skip_zero:
+            mask[mask] = np.trunc(score[mask]) != 0
+        if rubric.weight:
+            pts[:, j] = np.bincount(codes[mask], weights=score[mask] * weight[mask], minlength=n)
+            total[:, j] = np.bincount(codes[mask], weights=weight[mask] * rubric.scale, minlength=n)
+        else:
+            pts[:, j] = np.bincount(codes[mask], weights=score[mask], minlength=n)
+            total[:, j] = np.bincount(codes[mask], minlength=n) * float(rubric.scale)
+
+    comments, comment_keys = {}, {}
+    if rubric.comment:
+        has_comment = rows & (table[rubric.comment] != "").to_numpy()
+        commented = table[has_comment].sort_values("key", kind="stable").groupby("reviewee", sort=False)
+        comments = commented[rubric.comment].agg(list).to_dict()
+        comment_keys = commented["key"].agg(list).to_dict()
+
+    return Tally(rubric, keys, pts, total, comments, comment_keys)
@@ -0,0 +1,89 @@
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from rubrics import Rubric, Tally
+
+
+SNAPSHOT_DIR = Path(".cache") / "incremental"
+
+
+#LOCAL SNAPSHOT OF A GRADED SURVEY SO RE-RUNS ONLY SCORE NEW FIREBASE RESPONSES
+class SurveySnapshot:
+    # Firebase push keys are time ordered, so the last key seen per reviewer marks what has been scored
+    def __init__(self, node: str, rubrics: list[Rubric]):
+        self.node = node
+        self.rubrics = rubrics
+
+        #{reviewer: last push key already scored}
+        self.last_keys = {}
+        #running sums per rubric, in the same order as rubrics
+        self.tallies = None
+        #latest non-empty value of extra response columns {column: {reviewee: value}}
+        self.last_values = {}
+        #previous gradebook {reviewee: [score, text_feedback]}
+        self.gradebook = {}
+        #survey specific state, e.g. course feedback for the final peer evaluation
+        self.data = {}
+
+    @property
+    def path(self) -> Path:
+        return SNAPSHOT_DIR / f"{self.node}.json"
+
+    @classmethod
+    def load(cls, node: str, rubrics: list[Rubric]) -> "SurveySnapshot":
+        snapshot = cls(node, rubrics)
+        if not snapshot.path.exists():
+            return snapshot
+
+        with open(snapshot.path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+
+        snapshot.last_keys = saved["last_keys"]
+        if saved["tallies"]:
+            snapshot.tallies = [Tally.from_dict(rubric, data) for rubric, data in zip(rubrics, saved["tallies"])]
+        snapshot.last_values = saved["last_values"]
+        snapshot.gradebook = saved["gradebook"]
+        snapshot.data = saved["data"]
+        return snapshot
+
+    def save(self):
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        saved = {
+            "last_keys": self.last_keys,
+            "tallies": [t.to_dict() for t in self.tallies] if self.tallies else [],
+            "last_values": self.last_values,
+            "gradebook": self.gradebook,
+            "data": self.data,
+        }
+        #write then rename so an interrupted run never leaves a half written snapshot
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(saved, f)
+        os.replace(tmp, self.path)
+
+    def update(self, responses: dict, table: pd.DataFrame, tallies: list[Tally], extra: list[str] = (), skip_keys: tuple[str, ...] = ()) -> set:
+        #fold newly fetched responses into the snapshot, returns the reviewees whose scores changed
+        for reviewer, reviewer_responses in responses.items():
+            if not isinstance(reviewer_responses, dict):
+                continue
+            #non-response children (e.g. me4842_comments) sort after push keys, so they are always refetched whole
+            for name in skip_keys:
+                if name in reviewer_responses:
+                    self.data.setdefault(name, {})[reviewer] = reviewer_responses[name]
+            push_keys = [key for key in reviewer_responses if key.startswith('-')]
+            if push_keys:
+                self.last_keys[reviewer] = max(push_keys + [self.last_keys.get(reviewer, '')])
+
+        if self.tallies is None:
+            self.tallies = tallies
+        else:
+            self.tallies = [old.merge(new) for old, new in zip(self.tallies, tallies)]
+
+        for name in extra:
+            latest = table.dropna(subset=[name]).groupby("reviewee", sort=False)[name].last()
+            self.last_values.setdefault(name, {}).update(latest.to_dict())
+
+        return set(table["reviewee"])
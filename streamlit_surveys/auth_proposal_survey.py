@@ -2,10 +2,11 @@ import streamlit as st
 import time
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-from collections import defaultdict
 import random
 import firebase_admin
 from firebase_admin import credentials, db
+import repo_path #puts the repo root on sys.path for roster.py
+from roster import Roster
 import numpy as np
 
 # =========================
@@ -55,16 +56,9 @@ def protected_app():
     st.session_state.setdefault("dialog_completed", False)
 
     # --- Import student data from secrets (TOML list of "section, group, name") ---
-    nested = defaultdict(lambda: defaultdict(list))
-    for entry in st.secrets["class_list"]["students"]:
-        section, group, name, email = entry.split(",", 2)
-        nested[section.strip()][group.strip()].append(name.strip())
-
-    students_by_section_group = {s: dict(groups) for s, groups in nested.items()}
-    students_by_section = {
-        section: [student for group in groups.values() for student in group]
-        for section, groups in students_by_section_group.items()
-    }
+    roster = Roster.from_secrets(st.secrets["class_list"]["students"])
+    students_by_section_group = roster.section_groups()
+    students_by_section = roster.section_students()
 
     # --- Submission dialog ---
     @st.dialog("Feedback submitted!")
@@ -2,10 +2,11 @@ import streamlit as st
 import time
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-from collections import defaultdict
 import random
 import firebase_admin
 from firebase_admin import credentials, db
+import repo_path #puts the repo root on sys.path for roster.py
+from roster import Roster
 import numpy as np
 
 #these should persist between sessions
@@ -39,40 +40,16 @@ def all_scores_filled(ind_scores):
 	return scored_filled
 
 
-allowed_email_list = []
+#import student data from toml file, indexed by login id, name, section and group
+roster = Roster.from_secrets(st.secrets["class_list"]["students"])
 
-#import student data from toml file
-nested = defaultdict(lambda: defaultdict(list))
-
-student_dict = {}
-
-for entry in st.secrets["class_list"]["students"]:
-	section, group, name, emails = entry.split(",", 3)
-	section = section.strip()
-	group = group.strip()
-	name = name.strip()
-	email_id = emails.strip().split('@')[0]
-	allowed_email_list.append(email_id)
-	nested[section][group].append(name)
-	student_dict[email_id] = {}
-	student_dict[email_id]['section'] = section
-	student_dict[email_id]['group'] = group
-	student_dict[email_id]['name'] = name
-					
 
 def is_allowed(sign_in_id: str) -> bool:
-	is_allowed = False
-	for email_id in student_dict.keys():
-		if email_id == sign_in_id:
-			is_allowed = True
-	return is_allowed
+	return sign_in_id in roster.by_login
 
-students_by_section_group = {s: dict(groups) for s, groups in nested.items()}
+students_by_section_group = roster.section_groups()
 
-students_by_section = {
-	section: [student for group in groups.values() for student in group]
-	for section, groups in students_by_section_group.items()
-}
+students_by_section = roster.section_students()
 
 #submission dialog popup
 @st.dialog("Feedback submitted!")
@@ -109,9 +86,10 @@ if st.user.is_logged_in:
 
 		#user identification, must be sequential
 		# section_dropdown = st.selectbox("Select your section",options=["Click to Select"] + list(students_by_section.keys()),key='active_section')
-		st.session_state['active_section'] = student_dict[sign_in_id]['section']
-		st.session_state['active_group'] = student_dict[sign_in_id]['group']
-		st.session_state['active_user'] = student_dict[sign_in_id]['name']
+		student = roster.by_login[sign_in_id]
+		st.session_state['active_section'] = student.section
+		st.session_state['active_group'] = student.group
+		st.session_state['active_user'] = student.name
 
 		ref = db.reference(f"Final_Peer_Evaluations/{st.session_state['active_user']}")
 		
@@ -1,11 +1,11 @@
 import streamlit as st
 import time
-from collections import defaultdict
 import random
-from collections import defaultdict
 import random
 import firebase_admin
 from firebase_admin import credentials, db
+import repo_path #puts the repo root on sys.path for roster.py
+from roster import Roster
 
 
 #these should persist between sessions
@@ -27,19 +27,11 @@ if "awaiting_confirm" not in st.session_state:
 	st.session_state.awaiting_confirm = False
 
 #import student data from toml file
-nested = defaultdict(lambda: defaultdict(list))
+class_roster = Roster.from_secrets(st.secrets["class_list"]["students"])
 
-for entry in st.secrets["class_list"]["students"]:
-    sec, grp, nm, email = entry.split(",")
-    sec, grp, nm, email = sec.strip(), grp.strip(), nm.strip(),email.strip()
-    nested[sec][grp].append(nm)
+students_by_section_group = class_roster.section_groups()
 
-students_by_section_group = {s: dict(groups) for s, groups in nested.items()}
-
-students_by_section = {
-    section: [student for group in groups.values() for student in group]
-    for section, groups in students_by_section_group.items()
-}
+students_by_section = class_roster.section_students()
 all_students = [student for students in students_by_section.values() for student in students]
 
 
@@ -2,10 +2,11 @@ import streamlit as st
 import time
 
 import pandas as pd
-from collections import defaultdict
 import random
 import firebase_admin
 from firebase_admin import credentials, db
+import repo_path #puts the repo root on sys.path for roster.py
+from roster import Roster
 import numpy as np
 
 #these should persist between sessions
@@ -63,26 +64,9 @@ if st.session_state.dialog_completed and st.session_state.get("review_more_dialo
     st.rerun()
 
 
-allowed_email_list = []
+#import student data from toml file, indexed by login id, name, section and group
+roster = Roster.from_secrets(st.secrets["class_list"]["students"])
 
-#import student data from toml file
-nested = defaultdict(lambda: defaultdict(list))
-
-student_dict = {}
-
-for entry in st.secrets["class_list"]["students"]:
-	section, group, name, emails = entry.split(",", 3)
-	section = section.strip()
-	group = group.strip()
-	name = name.strip()
-	email_id = emails.strip().split('@')[0]
-	allowed_email_list.append(email_id)
-	nested[section][group].append(name)
-	student_dict[email_id] = {}
-	student_dict[email_id]['section'] = section
-	student_dict[email_id]['group'] = group
-	student_dict[email_id]['name'] = name
-					
 
 def is_allowed(sign_in_id: str) -> bool:
 	is_allowed = False
@@ -91,12 +75,9 @@ def is_allowed(sign_in_id: str) -> bool:
 		is_allowed = True
 	return is_allowed
 
-students_by_section_group = {s: dict(groups) for s, groups in nested.items()}
+students_by_section_group = roster.section_groups()
 
-students_by_section = {
-	section: [student for group in groups.values() for student in group]
-	for section, groups in students_by_section_group.items()
-}
+students_by_section = roster.section_students()
 
 def init_firebase():
     # Only initialize once
@@ -1,8 +1,9 @@
 import streamlit as st
 import pandas as pd
-from collections import defaultdict
 import firebase_admin
 from firebase_admin import credentials, db
+import repo_path #puts the repo root on sys.path for roster.py
+from roster import Roster
 import numpy as np
 
 if "active_section" in st.session_state:
@@ -46,35 +47,12 @@ def all_scores_filled(group_dict, individual_dicts):
     return scored_filled
 
 
-# --- ADDED SIGN-IN STRUCTURE: allowed-email data containers for Google sign-in access control ---
-allowed_email_list = []
+#import student data from toml file, indexed by the Google-login identifier for sign-in access control
+roster = Roster.from_secrets(st.secrets["class_list"]["students"])
 
-#import student data from toml file
-nested = defaultdict(lambda: defaultdict(list))
-student_dict = {}
+students_by_section_group = roster.section_groups()
 
-for entry in st.secrets["class_list"]["students"]:
-    section, group, name,email = entry.split(",", 3)
-    section = section.strip()
-    group = group.strip()
-    name = name.strip()
-    email = email.strip()
-    email_id = email.split('@')[0]  # --- ADDED SIGN-IN STRUCTURE: store Google-login identifier ---
-    allowed_email_list.append(email_id)  # --- ADDED SIGN-IN STRUCTURE: whitelist for login access ---
-    nested[section][group].append(name)
-    student_dict[email_id] = {  # --- ADDED SIGN-IN STRUCTURE: map signed-in user to survey identity ---
-        "section": section,
-        "group": group,
-        "name": name,
-        "email": email,
-    }
-
-students_by_section_group = {s: dict(groups) for s, groups in nested.items()}
-
-students_by_section = {
-    section: [student for group in groups.values() for student in group]
-    for section, groups in students_by_section_group.items()
-}
+students_by_section = roster.section_students()
 
 instructor_dict = {}
 
@@ -90,11 +68,7 @@ for entry in st.secrets["class_list"]["instructors"]:
 
 # --- ADDED SIGN-IN STRUCTURE: access-check helper from the signed-in survey ---
 def is_allowed(sign_in_id: str) -> bool:
-    is_allowed = False
-    for email_id in student_dict.keys():
-        if email_id == sign_in_id:
-            is_allowed = True
-    return is_allowed
+    return sign_in_id in roster.by_login
 
 def is_instructor(sign_in_id: str) -> bool:
     return sign_in_id in instructor_dict
@@ -174,8 +148,8 @@ if st.user.is_logged_in:
                 key='active_section'
             )
         else:
-            st.session_state.active_section = student_dict[sign_in_id]['section']
-            st.session_state.active_user = student_dict[sign_in_id]['name']
+            st.session_state.active_section = roster.by_login[sign_in_id].section
+            st.session_state.active_user = roster.by_login[sign_in_id].name
             st.markdown(f'#### Name: :green[{st.session_state["active_user"]}]')
             st.markdown(f'#### Section: :green[{st.session_state["active_section"]}]')
         ref = db.reference(f"Proposal_Responses/{st.session_state['active_user']}")
@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+#roster.py lives in the repo root, one level above the surveys
+#streamlit only puts this folder on sys.path, importing this module adds the root as well
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.append(str(ROOT))
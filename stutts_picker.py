@@ -36,6 +36,9 @@ Capacity & Feasibility
 - We schedule EXACTLY two elective weeks (Weeks 2 & 3), so each elective
   can host up to TWO groups total across those weeks (one in Week 2 and one in Week 3).
 - With 5 electives × 1 station per week, at most 5 groups in the section.
+- --capacity and --weeks lift these defaults: any number of stations per
+  elective (optionally different per week) and any number of elective weeks.
+  A section is feasible when the stations can seat every group each week.
 
 Cost model
 ----------
@@ -53,6 +56,8 @@ Outputs (Excel)
 - Roster: the exact groups used.
 - Week1_HeatTransfer: explicit per-group listing for Week 1.
 - Capacities: per-week capacity/assigned/remaining for all experiments.
+With --output *.json (or --format json) the same tables are written as one JSON
+document; with *.csv each table goes to <stem>_<sheet>.csv.
 
 CLI
 ---
@@ -60,14 +65,30 @@ python3 scheduler_ranked_preferences.py \
   --input FS_ranked_prefs_input.xlsx \
   --output schedule_out.xlsx \
   --seed 42 \
-  --unlisted-penalty 5
+  --unlisted-penalty 5 \
+  --capacity 2 Acoustics=1:2 \
+  --weeks 2
+
+Seed / penalty sweep (how much the schedule depends on tie-breaking):
+python3 scheduler_ranked_preferences.py \
+  --input FS_ranked_prefs_input.xlsx \
+  --sweep 1000 --sweep-penalties 3 5 8 \
+  --output sweep_out.xlsx
 """
 
 from __future__ import annotations
 import argparse
+import csv
+import heapq
+import importlib.util
+import itertools
 import sys
 import json
-from typing import Dict, List, Tuple, Any
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Tuple, Any, Union
 
 import numpy as np
 import pandas as pd
@@ -75,86 +96,131 @@ import pandas as pd
 # Electives to schedule in Weeks 2 & 3 (Heat Transfer is fixed to Week 1)
 ELECTIVES: List[str] = ['Acoustics', 'Pump', 'Tuned Mass Damper', 'Dynamic Balancing', 'Piezoelectric']
 
+# Solvers and write_output take costs/ranks either as (groups x ELECTIVES) arrays or as nested dicts
+CostTable = Union[np.ndarray, Dict[str, Dict[str, float]]]
+RankTable = Union[np.ndarray, Dict[str, Dict[str, int | None]]]
+
+# Sweep reports rank an unlisted elective after every listed rank
+UNLISTED_RANK: int = len(ELECTIVES) + 1
+
+# Nodes plan_branch_and_bound explores before settling for its best schedule so far
+BRANCH_NODE_LIMIT: int = 5000
+
+# Formats write_output can produce
+OUTPUT_FORMATS: List[str] = ["xlsx", "json", "csv"]
+
 
 # ---------------------------------------------------------------------------
 # Input parsing and cost matrix construction
 # ---------------------------------------------------------------------------
 
-def process_input_and_build_costs(
+def group_names(values) -> Tuple[np.ndarray, List[str]]:
+    """
+    Positions of the entries that name a group, and the stripped names.
+    Blank, missing and "nan" group names are skipped; a repeated name is an error.
+    """
+    names = pd.Series(values, dtype=object)
+    stripped = names.where(names.isna(), names.astype(str).str.strip())
+    keep = (stripped.notna() & (stripped != "") & (stripped.str.lower() != "nan")).to_numpy(dtype=bool)
+    kept = stripped[keep]
+    duplicated = kept.duplicated()
+    if duplicated.any():
+        raise ValueError(f'Duplicate group name detected: "{kept[duplicated].iloc[0]}". Group names must be unique.')
+    return np.flatnonzero(keep), kept.tolist()
+
+
+def validate_ranks(groups: List[str], values: np.ndarray, electives: List[str]) -> np.ndarray:
+    """
+    Check a (groups x electives) float array of ranks (NaN = unranked) in one pass and
+    return it as an int array with 0 for unranked electives.
+
+    Rules:
+      - Ranks are within 1..5 (one per elective).
+      - No rank is used twice by the same group.
+      - Each group ranks 4 or 5 electives.
+    Errors name the first offending group.
+    """
+    present = ~np.isnan(values)
+    ranks = np.where(present, values, 0).astype(int)
+    out_of_range = present & ((ranks < 1) | (ranks > len(electives)))
+    ordered = np.sort(ranks, axis=1)
+    duplicate = (ordered[:, 1:] == ordered[:, :-1]) & (ordered[:, 1:] > 0)
+    n_ranked = present.sum(axis=1)
+    wrong_count = (n_ranked < 4) | (n_ranked > 5)
+
+    bad = out_of_range.any(axis=1) | duplicate.any(axis=1) | wrong_count
+    if bad.any():
+        i = int(np.argmax(bad))
+        g = groups[i]
+        if out_of_range[i].any():
+            j = int(np.argmax(out_of_range[i]))
+            raise ValueError(f'Ranks must be within 1..{len(electives)}. Found {ranks[i, j]} for "{g}" / "{electives[j]}"')
+        if duplicate[i].any():
+            r = ordered[i, 1:][duplicate[i]][0]
+            raise ValueError(f'Duplicate rank {r} for group "{g}". Use each rank once.')
+        raise ValueError(f'Group "{g}" must rank 4 or 5 electives (ranked {n_ranked[i]}).')
+    return ranks
+
+
+def build_cost_matrix(ranks: np.ndarray, unlisted_penalty: int, seed: int | None) -> np.ndarray:
+    """
+    Cost = (rank-1) if ranked; else UNLISTED_PENALTY, plus a tiny jitter to break ties.
+    The jitter is drawn in one call, row by row, so it matches per-cell draws for the same seed.
+    """
+    rng = np.random.default_rng(seed)
+    base = np.where(ranks > 0, ranks - 1, float(unlisted_penalty))
+    return base + rng.uniform(0, 1e-4, size=ranks.shape)  # tiny, only for tie-breaking
+
+
+def process_input_arrays(
     input_data: List[Dict[str, Any]],
     electives: List[str],
     unlisted_penalty: int,
     seed: int | None
-) -> Tuple[List[str], Dict[str, Dict[str, float]], Dict[str, Dict[str, int | None]]]:
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
     """
-    Build:
+    Build from [{"Group": name, "Electives": [favorite, ..., least favorite]}]:
       - groups: list[str]
-      - costs: dict[group][elective] -> float
-      - ranks: dict[group][elective] -> int|None (None if unranked)
+      - costs: float array (groups x ELECTIVES)
+      - ranks: int array (groups x ELECTIVES), 0 if unranked
 
     Rules:
+      - electives must list ELECTIVES, in any order; the columns always follow ELECTIVES,
+        the order every solver and writer reads them in.
       - Each entry must have a non-empty unique Group value.
-      - Each group must rank 4 or 5 electives, using 1..5 with no duplicates.
-      - Cost = (rank-1) if ranked; else UNLISTED_PENALTY.
-      - A tiny random jitter is added to each (g,e) cost to break ties.
+      - Each group must rank 4 or 5 electives, each at most once.
+      - Rank = position in the list (favorite first).
     """
-    rng = np.random.default_rng(seed)
-    groups: List[str] = []
-    ranks: Dict[str, Dict[str, int | None]] = {}
-    costs: Dict[str, Dict[str, float]] = {}
-
-    seen = set()
-    for entry in input_data:
-        g_raw = entry.get("Group", None)
-        if g_raw is None:
-            continue
-        g = str(g_raw).strip()
-        if not g or g.lower() == "nan":
-            continue
-        if g in seen:
-            raise ValueError(f'Duplicate group name detected: "{g}". Group names must be unique.')
-
-        # Collect ranks (based on the order of electives in the list)
-        rank_vals: Dict[str, int] = {}
-        ranked_electives = entry.get("Electives", [])
-
+    if len(electives) != len(ELECTIVES) or set(electives) != set(ELECTIVES):
+        raise ValueError(f"Electives must be {ELECTIVES} in any order, got {list(electives)}.")
+    keep, groups = group_names([entry.get("Group", None) for entry in input_data])
+    column = {e: j for j, e in enumerate(ELECTIVES)}
+
+    values = np.full((len(groups), len(ELECTIVES)), np.nan)
+    for i, (g, k) in enumerate(zip(groups, keep)):
+        ranked_electives = input_data[k].get("Electives", [])
         if not 4 <= len(ranked_electives) <= 5:
             raise ValueError(f'Group "{g}" must rank between 4 and 5 electives (ranked {len(ranked_electives)}).')
+        invalid = [e for e in ranked_electives if e not in column]
+        if invalid:
+            raise ValueError(f'Invalid elective "{invalid[0]}" for group "{g}".')
+        if len(set(ranked_electives)) != len(ranked_electives):
+            raise ValueError(f'Group "{g}" ranks an elective more than once.')
+        values[i, [column[e] for e in ranked_electives]] = np.arange(1, len(ranked_electives) + 1)
 
-        # Assign ranks based on their position in the list (favorite first, least favorite last)
-        for idx, elective in enumerate(ranked_electives):
-            # Dirty hack.
-            if elective not in electives:
-                raise ValueError(f'Invalid elective "{elective}" for group "{g}".')
-            rank_vals[elective] = idx + 1  # Rank starts from 1
-
-        seen.add(g)
-        groups.append(g)
-        ranks[g] = {e: rank_vals.get(e, None) for e in electives}
-
-        # Build cost row with jitter
-        costs[g] = {}
-        for e in electives:
-            base = (rank_vals.get(e, None) - 1) if e in rank_vals else float(unlisted_penalty)
-            jitter = rng.uniform(0, 1e-4)  # tiny, only for tie-breaking
-            costs[g][e] = base + jitter
+    ranks = validate_ranks(groups, values, ELECTIVES)
+    return groups, build_cost_matrix(ranks, unlisted_penalty, seed), ranks
 
-    return groups, costs, ranks
 
-
-def read_input_and_build_costs(path: str, sheet: str, unlisted_penalty: int, seed: int | None
-                               ) -> Tuple[List[str], Dict[str, Dict[str, float]], Dict[str, Dict[str, int | None]]]:
+def read_input_arrays(path: str, sheet: str, unlisted_penalty: int, seed: int | None
+                      ) -> Tuple[List[str], np.ndarray, np.ndarray]:
     """
-    Read the Excel input and build:
-      - groups: list[str]
-      - costs: dict[group][elective] -> float
-      - ranks: dict[group][elective] -> int|None (None if unranked)
+    Read the Excel input and build the same arrays as process_input_arrays
+    (columns in ELECTIVES order).
 
     Rules:
       - Each kept row must have a non-empty unique Group value.
       - Each group must rank 4 or 5 electives, using 1..5 with no duplicates.
-      - Cost = (rank-1) if ranked; else UNLISTED_PENALTY.
-      - A tiny random jitter is added to each (g,e) cost to break ties.
     """
     df = pd.read_excel(path, sheet_name=sheet, dtype=object)
 
@@ -165,98 +231,544 @@ def read_input_and_build_costs(path: str, sheet: str, unlisted_penalty: int, see
     if missing:
         raise ValueError(f"Missing elective column(s): {missing}. Expected columns: {ELECTIVES}")
 
-    rng = np.random.default_rng(seed)
-    groups: List[str] = []
-    ranks: Dict[str, Dict[str, int | None]] = {}
-    costs: Dict[str, Dict[str, float]] = {}
-
-    seen = set()
-    for _, row in df.iterrows():
-        g_raw = row.get("Group", None)
-        if pd.isna(g_raw):
-            continue
-        g = str(g_raw).strip()
-        if not g or g.lower() == "nan":
-            continue
-        if g in seen:
-            raise ValueError(f'Duplicate group name detected: "{g}". Group names must be unique.')
+    keep, groups = group_names(df["Group"].to_numpy())
+    block = df[ELECTIVES].iloc[keep]
+    numeric = block.apply(pd.to_numeric, errors="coerce")
+    non_integer = (block.notna() & numeric.isna()).to_numpy()
+    if non_integer.any():
+        i, j = np.argwhere(non_integer)[0]
+        raise ValueError(f'Non-integer rank for group "{groups[i]}", elective "{ELECTIVES[j]}": {block.iat[i, j]!r}')
 
-        # Collect ranks
-        rank_vals: Dict[str, int] = {}
-        for e in ELECTIVES:
-            v = row[e]
-            if pd.isna(v):
+    ranks = validate_ranks(groups, np.trunc(numeric.to_numpy(dtype=float)), ELECTIVES)
+    return groups, build_cost_matrix(ranks, unlisted_penalty, seed), ranks
+
+
+def as_dicts(groups: List[str], costs: np.ndarray, ranks: np.ndarray, electives: List[str]
+             ) -> Tuple[Dict[str, Dict[str, float]], Dict[str, Dict[str, int | None]]]:
+    """
+    Nested dict view of the arrays:
+      - costs: dict[group][elective] -> float
+      - ranks: dict[group][elective] -> int|None (None if unranked)
+    """
+    cost_dict = {g: dict(zip(electives, row)) for g, row in zip(groups, costs.tolist())}
+    rank_dict = {g: {e: (r or None) for e, r in zip(electives, row)} for g, row in zip(groups, ranks.tolist())}
+    return cost_dict, rank_dict
+
+
+def process_input_and_build_costs(
+    input_data: List[Dict[str, Any]],
+    electives: List[str],
+    unlisted_penalty: int,
+    seed: int | None
+) -> Tuple[List[str], Dict[str, Dict[str, float]], Dict[str, Dict[str, int | None]]]:
+    """
+    Dict view of process_input_arrays: (groups, costs[group][elective], ranks[group][elective]).
+    """
+    groups, costs, ranks = process_input_arrays(input_data, electives, unlisted_penalty, seed)
+    return (groups, *as_dicts(groups, costs, ranks, ELECTIVES))
+
+
+def read_input_and_build_costs(path: str, sheet: str, unlisted_penalty: int, seed: int | None
+                               ) -> Tuple[List[str], Dict[str, Dict[str, float]], Dict[str, Dict[str, int | None]]]:
+    """
+    Dict view of read_input_arrays: (groups, costs[group][elective], ranks[group][elective]).
+    """
+    groups, costs, ranks = read_input_arrays(path, sheet, unlisted_penalty, seed)
+    return (groups, *as_dicts(groups, costs, ranks, ELECTIVES))
+
+
+def as_cost_matrix(groups: List[str], costs: CostTable) -> np.ndarray:
+    """
+    Dense (groups x ELECTIVES) float view of either cost form the solvers accept.
+    Arrays must already have their columns in ELECTIVES order, as process_input_arrays
+    and read_input_arrays build them; dicts are read by elective name.
+    """
+    if isinstance(costs, np.ndarray):
+        if costs.shape != (len(groups), len(ELECTIVES)):
+            raise ValueError(f"Cost matrix must have shape {(len(groups), len(ELECTIVES))}, got {costs.shape}.")
+        return costs.astype(float, copy=False)
+    return np.array([[costs[g][e] for e in ELECTIVES] for g in groups], dtype=float).reshape(len(groups), len(ELECTIVES))
+
+
+def as_rank_matrix(groups: List[str], ranks: RankTable) -> np.ndarray:
+    """
+    Dense (groups x ELECTIVES) int view of either rank form, 0 if unranked.
+    """
+    if isinstance(ranks, np.ndarray):
+        return ranks.astype(int, copy=False)
+    return np.array([[ranks[g][e] or 0 for e in ELECTIVES] for g in groups], dtype=int).reshape(len(groups), len(ELECTIVES))
+
+
+# ---------------------------------------------------------------------------
+# Exact solver: min-cost flow + bipartite edge colouring (no external solver)
+# ---------------------------------------------------------------------------
+def min_cost_flow(n_nodes: int, edges: List[Tuple[int, int, int, float]], source: int, sink: int, demand: int):
+    """
+    Successive shortest paths with Dijkstra on reduced costs (all input costs >= 0).
+    edges: (u, v, capacity, cost). Returns (flow per edge, total cost), or None when
+    fewer than `demand` units can be routed from source to sink.
+    """
+    # Residual graph: edge 2k is the forward arc of edges[k], 2k+1 its reverse
+    head: List[List[int]] = [[] for _ in range(n_nodes)]
+    to: List[int] = []
+    cap: List[int] = []
+    cost: List[float] = []
+    for u, v, c, w in edges:
+        head[u].append(len(to)); to.append(v); cap.append(c); cost.append(w)
+        head[v].append(len(to)); to.append(u); cap.append(0); cost.append(-w)
+
+    potential = [0.0] * n_nodes
+    flow = 0
+    total = 0.0
+    while flow < demand:
+        dist = [float("inf")] * n_nodes
+        prev = [-1] * n_nodes
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
                 continue
-            try:
-                r = int(v)
-            except Exception:
-                raise ValueError(f'Non-integer rank for group "{g}", elective "{e}": {v!r}')
-            if not (1 <= r <= 5):
-                raise ValueError(f'Ranks must be within 1..5. Found {r} for "{g}" / "{e}"')
-            if r in rank_vals.values():
-                raise ValueError(f'Duplicate rank {r} for group "{g}". Use each rank once.')
-            rank_vals[e] = r
-
-        if len(rank_vals) < 4 or len(rank_vals) > 5:
-            raise ValueError(f'Group "{g}" must rank 4 or 5 electives (ranked {len(rank_vals)}).')
-
-        seen.add(g)
-        groups.append(g)
-        ranks[g] = {e: rank_vals.get(e, None) for e in ELECTIVES}
-
-        # Build cost row with jitter
-        costs[g] = {}
-        for e in ELECTIVES:
-            base = (rank_vals[e] - 1) if e in rank_vals else float(unlisted_penalty)
-            jitter = rng.uniform(0, 1e-4)  # tiny, only for tie-breaking
-            costs[g][e] = base + jitter
+            for a in head[u]:
+                if cap[a] <= 0:
+                    continue
+                v = to[a]
+                nd = d + cost[a] + potential[u] - potential[v]
+                if nd < dist[v] - 1e-12:
+                    dist[v] = nd
+                    prev[v] = a
+                    heapq.heappush(heap, (nd, v))
+        if dist[sink] == float("inf"):
+            return None
+        for v in range(n_nodes):
+            if dist[v] < float("inf"):
+                potential[v] += dist[v]
+
+        # Bottleneck along the path, then augment
+        push = demand - flow
+        v = sink
+        while v != source:
+            a = prev[v]
+            push = min(push, cap[a])
+            v = to[a ^ 1]
+        v = sink
+        while v != source:
+            a = prev[v]
+            cap[a] -= push
+            cap[a ^ 1] += push
+            total += push * cost[a]
+            v = to[a ^ 1]
+        flow += push
+
+    return [cap[2 * k + 1] for k in range(len(edges))], total
+
+
+def colour_bipartite_edges(edges: List[Tuple[Any, Any]], n_colours: int) -> List[int]:
+    """
+    Proper edge colouring of a bipartite (multi)graph whose maximum degree is at most
+    n_colours (König): each edge gets a colour 0..n_colours-1 and no vertex sees a colour
+    twice. Conflicts are resolved by swapping the two colours along an alternating path.
+    """
+    at: Dict[Any, Dict[int, int]] = {}   # vertex -> {colour: edge index}
+    colour = [-1] * len(edges)
+
+    def free(vertex):
+        used = at.setdefault(vertex, {})
+        return next(c for c in range(n_colours) if c not in used)
+
+    for k, (u, v) in enumerate(edges):
+        a = free(u)
+        b = free(v)
+        if a not in at[v]:
+            b = a
+        else:
+            # Walk the a/b alternating path from v and swap it; in a bipartite graph it never reaches u
+            path = []
+            vertex, c = v, a
+            while c in at[vertex]:
+                e = at[vertex][c]
+                path.append(e)
+                x, y = edges[e]
+                vertex = y if x == vertex else x
+                c = b if c == a else a
+            for e in path:
+                x, y = edges[e]
+                del at[x][colour[e]]
+                del at[y][colour[e]]
+            for e in path:
+                x, y = edges[e]
+                colour[e] = b if colour[e] == a else a
+                at[x][colour[e]] = e
+                at[y][colour[e]] = e
+            b = a
+        colour[k] = b
+        at[u][b] = k
+        at[v][b] = k
+
+    return colour
+
+
+def capacity_matrix(capacity: Any, T: int, electives: List[str] | None = None) -> np.ndarray:
+    """
+    Normalize a capacity spec to an int array of shape (T, len(electives)):
+      - None                      -> one station per elective per week
+      - int                       -> that many stations for every elective and week
+      - dict[elective] -> int     -> per-elective, same every week (missing electives get 1)
+      - dict[elective] -> [c1..cT]-> per-elective, per-week
+      - array (T, n_electives)    -> used as is
+    """
+    electives = ELECTIVES if electives is None else electives
+    if capacity is None:
+        return np.ones((T, len(electives)), dtype=int)
+    if isinstance(capacity, (int, np.integer)):
+        return np.full((T, len(electives)), int(capacity), dtype=int)
+    if isinstance(capacity, dict):
+        unknown = [e for e in capacity if e not in electives]
+        if unknown:
+            raise ValueError(f"Capacity given for unknown elective(s): {unknown}")
+        cap = np.ones((T, len(electives)), dtype=int)
+        for j, e in enumerate(electives):
+            value = capacity.get(e, 1)
+            if isinstance(value, (list, tuple, np.ndarray)):
+                if len(value) != T:
+                    raise ValueError(f'Capacity for "{e}" lists {len(value)} weeks, expected {T}.')
+                cap[:, j] = value
+            else:
+                cap[:, j] = int(value)
+    else:
+        cap = np.asarray(capacity, dtype=int)
+        if cap.shape != (T, len(electives)):
+            raise ValueError(f"Capacity array must have shape {(T, len(electives))}, got {cap.shape}.")
+    if (cap < 0).any():
+        raise ValueError("Capacities must be non-negative.")
+    return cap
+
+
+def build_result(groups: List[str], cost_matrix: np.ndarray, assignments: List[Tuple[int, int, int]], T: int) -> Dict[str, Any]:
+    """
+    Common result structure for every solver from (group index, elective index, week) triples:
+      - schedule[t][e]  -> list of groups doing elective e in elective week t (1..T)
+      - by_group[g][e]  -> elective week t
+      - group_cost[g], total_cost
+    """
+    schedule = {t: {e: [] for e in ELECTIVES} for t in range(1, T + 1)}
+    by_group = {g: {} for g in groups}
+    group_cost = {g: 0.0 for g in groups}
+    for i, j, t in assignments:
+        g, e = groups[i], ELECTIVES[j]
+        schedule[t][e].append(g)
+        by_group[g][e] = t
+        group_cost[g] += float(cost_matrix[i, j])
+    return {"schedule": schedule, "by_group": by_group, "total_cost": sum(group_cost.values()), "group_cost": group_cost}
 
-    return groups, costs, ranks
 
+def choose_electives(cost_matrix: np.ndarray, T: int, totals: np.ndarray) -> Tuple[List[Tuple[int, int]], float] | None:
+    """
+    Min-cost flow that picks T distinct electives per group with elective j used at most
+    totals[j] times (source -> group cap T -> elective cap 1 -> sink cap totals[j]).
+    Returns the chosen (group, elective) pairs and their cost, or None if impossible.
+    """
+    n, m = cost_matrix.shape
+    source, sink = n + m, n + m + 1
+    edges = [(source, i, T, 0.0) for i in range(n)]
+    pair_edges = []
+    for i in range(n):
+        for j in range(m):
+            if totals[j] > 0:
+                pair_edges.append((i, j))
+                edges.append((i, n + j, 1, float(cost_matrix[i, j])))
+    edges += [(n + j, sink, int(totals[j]), 0.0) for j in range(m)]
+
+    solved = min_cost_flow(n + m + 2, edges, source, sink, n * T)
+    if solved is None:
+        return None
+    flow, total = solved
+    return [pair for pair, f in zip(pair_edges, flow[n:n + len(pair_edges)]) if f > 0], total
+
+
+def solve_flow(groups: List[str], costs: CostTable, T: int = 2, capacity: Any = None):
+    """
+    Exact solver for the same model as solve_ilp, without PuLP or a CBC subprocess.
+
+    Costs do not depend on the week, so when every elective has the same number of
+    stations c_e in every week the problem splits in two:
+      1) Min-cost flow picks T distinct electives per group with elective e used at
+         most T*c_e times (see choose_electives).
+      2) Each elective's chosen groups are dealt onto c_e stations of at most T groups,
+         giving a bipartite graph of maximum degree T, which can always be coloured
+         with T weeks: every group gets one elective per week and every station hosts
+         one group per week.
+    Week-dependent capacities do not split this way (fixing the weeks is a three-index
+    assignment problem), see solve_varying_capacity.
+    """
+    cap = capacity_matrix(capacity, T)
+    cost_matrix = as_cost_matrix(groups, costs)
+    if (cap != cap[0]).any():
+        return solve_varying_capacity(groups, cost_matrix, T, cap)
+
+    assignments = uniform_assignments(cost_matrix, T, cap[0])
+    if assignments is None:
+        return None, "infeasible"
+    return build_result(groups, cost_matrix, assignments, T), "ok"
+
+
+def uniform_assignments(cost_matrix: np.ndarray, T: int, stations: np.ndarray) -> List[Tuple[int, int, int]] | None:
+    """
+    Optimal (group, elective, week) triples when elective j has stations[j] stations every
+    week: choose_electives, then each elective's groups are dealt T per station and the
+    weeks come from colour_bipartite_edges. None if the stations cannot seat everyone.
+    """
+    solved = choose_electives(cost_matrix, T, T * stations)
+    if solved is None:
+        return None
+    chosen, _ = solved
+
+    # Deal each elective's groups onto stations, T per station
+    dealt = [0] * cost_matrix.shape[1]
+    colour_edges = []
+    for i, j in chosen:
+        colour_edges.append((("g", i), ("e", j, dealt[j] // T)))
+        dealt[j] += 1
+    weeks = colour_bipartite_edges(colour_edges, T)
+    return [(i, j, week + 1) for (i, j), week in zip(chosen, weeks)]
+
+
+def solve_varying_capacity(groups: List[str], cost_matrix: np.ndarray, T: int, cap: np.ndarray):
+    """
+    Week-dependent capacities: branch and bound over plans (see plan_branch_and_bound),
+    exact like solve_ilp. Sections it cannot finish within BRANCH_NODE_LIMIT nodes get
+    the best schedule found so far with a warning, or no schedule (status "node_limit").
+    """
+    if (cap.sum(axis=1) < len(groups)).any():
+        return None, "infeasible"
+
+    assignments, status, bound = plan_branch_and_bound(cost_matrix, T, cap)
+    if assignments is None:
+        if status == "node_limit":
+            print(f"Warning: capacities change from week to week and branch and bound stopped after "
+                  f"{BRANCH_NODE_LIMIT} nodes without a schedule. Install PuLP and use --solver pulp.", file=sys.stderr)
+        return None, status
+    result = build_result(groups, cost_matrix, assignments, T)
+    if status == "node_limit":
+        print(f"Warning: capacities change from week to week and branch and bound stopped after {BRANCH_NODE_LIMIT} "
+              f"nodes; using the best schedule found (total cost {result['total_cost']:.4f}, at most "
+              f"{result['total_cost'] - bound:.4f} above optimal). Install PuLP for an exact answer.", file=sys.stderr)
+    return result, status
+
+
+def week_plans(cap: np.ndarray) -> np.ndarray:
+    """Every plan (a group's T distinct electives in week order) with a station in each of its weeks."""
+    T, m = cap.shape
+    plans = [p for p in itertools.permutations(range(m), T) if all(cap[t, p[t]] > 0 for t in range(T))]
+    return np.array(plans, dtype=int).reshape(-1, T)
+
+
+def _simplex(tableau: np.ndarray, basis: List[int], tol: float = 1e-9) -> None:
+    """
+    Primal simplex for a minimisation, in place. The last row holds the reduced costs and
+    the last column the basic values. Uses the most negative reduced cost, switching to
+    Bland's rule while pivots stop lowering the objective, so it cannot cycle.
+    """
+    rows = tableau.shape[0] - 1
+    stalled, last = 0, tableau[-1, -1]
+    while True:
+        candidates = np.flatnonzero(tableau[-1, :-1] < -tol)
+        if not len(candidates):
+            return
+        e = candidates[0] if stalled > 20 else candidates[np.argmin(tableau[-1, candidates])]
+        column = tableau[:-1, e]
+        ratio = np.full(rows, np.inf)
+        positive = column > tol
+        ratio[positive] = tableau[:-1, -1][positive] / column[positive]
+        # Never unbounded: every variable is capped by its group's row or its stations
+        ties = np.flatnonzero(ratio <= ratio.min() + tol)
+        l = ties[np.argmin(np.asarray(basis)[ties])]
+        tableau[l] /= tableau[l, e]
+        factors = tableau[:, e].copy()
+        factors[l] = 0
+        tableau -= np.outer(factors, tableau[l])
+        basis[l] = e
+        if tableau[-1, -1] < last - tol:
+            stalled, last = 0, tableau[-1, -1]
+        else:
+            stalled += 1
+
+
+def _plan_master(cost: np.ndarray, owner: np.ndarray, usage: np.ndarray, n: int, stations: np.ndarray,
+                 penalty: float):
+    """
+    LP over the given plan columns: each group's columns sum to 1, with an artificial
+    variable at cost penalty per group, and each (week, elective) holds at most its
+    stations. Returns (value, column values, artificials, group duals, station duals).
+    """
+    k, s = len(cost), len(stations)
+    rows, cols = n + s, k + s + n
+    tableau = np.zeros((rows + 1, cols + 1))
+    tableau[owner, np.arange(k)] = 1
+    tableau[n:rows, :k] = usage.T
+    tableau[n:rows, k:k + s] = np.eye(s)
+    tableau[:n, k + s:cols] = np.eye(n)
+    tableau[:n, -1] = 1
+    tableau[n:rows, -1] = stations
+    # Artificials and slacks start basic, so price the artificials out of the objective
+    tableau[-1, :k] = cost
+    tableau[-1] -= penalty * tableau[:n].sum(axis=0)
+    tableau[-1, k + s:cols] = 0
+    basis = list(range(k + s, cols)) + list(range(k, k + s))
+    _simplex(tableau, basis)
+
+    x = np.zeros(cols)
+    x[basis] = tableau[:-1, -1]
+    reduced = tableau[-1, :-1]
+    return -tableau[-1, -1], x[:k], x[k + s:], penalty - reduced[k + s:], -reduced[k:k + s]
+
+
+def _plan_lp(plan_cost: np.ndarray, usage: np.ndarray, allowed: np.ndarray, stations: np.ndarray,
+             penalty: float, columns: set):
+    """
+    Column generation: solve _plan_master over columns, then add each group's allowed plan
+    with the most negative reduced cost until none is left. Returns (value, x, artificials)
+    with x as a (groups x plans) array; columns grows in place.
+    """
+    n = plan_cost.shape[0]
+    while True:
+        owner, plan = map(np.array, zip(*sorted(columns)))
+        value, y, artificial, u, v = _plan_master(plan_cost[owner, plan], owner, usage[plan], n, stations, penalty)
+        reduced = np.where(allowed, plan_cost - u[:, None] - usage @ v, np.inf)
+        best = np.argmin(reduced, axis=1)
+        new = {(i, int(best[i])) for i in range(n) if reduced[i, best[i]] < -1e-9} - columns
+        if not new:
+            x = np.zeros_like(plan_cost)
+            x[owner, plan] = y
+            return value, x, artificial
+        columns |= new
+
+
+def solve_plan_lp(plan_cost: np.ndarray, usage: np.ndarray, allowed: np.ndarray, stations: np.ndarray):
+    """
+    LP relaxation of giving each group one allowed plan within the stations, a lower bound
+    for branch and bound. Returns (value, x) with x as a (groups x plans) array, or None
+    when even the relaxation cannot seat everyone.
+    """
+    cheapest = np.argsort(np.where(allowed, plan_cost, np.inf), axis=1)[:, :4]
+    columns = {(i, int(p)) for i, row in enumerate(cheapest) for p in row if allowed[i, p]}
+    penalty = 1000.0 * (1.0 + np.abs(plan_cost).max())
+    while True:
+        value, x, artificial = _plan_lp(plan_cost, usage, allowed, stations, penalty, columns)
+        if artificial.max() <= 1e-7:
+            return value, x
+        # An artificial is still in use: infeasible, unless the penalty was too small
+        if _plan_lp(np.zeros_like(plan_cost), usage, allowed, stations, 1.0, columns)[0] > 1e-7:
+            return None
+        penalty *= 1000.0
+
+
+def plan_branch_and_bound(cost_matrix: np.ndarray, T: int, cap: np.ndarray,
+                          node_limit: int = BRANCH_NODE_LIMIT) -> Tuple[List[Tuple[int, int, int]] | None, str, float]:
+    """
+    Exact solver for week-dependent capacities without PuLP. Each group chooses one plan
+    (its electives in week order); solve_plan_lp bounds every node and best-first search
+    branches on the most fractional (group, week, elective): one side keeps only the
+    group's plans with that elective in that week, the other only those without it.
+
+    Returns (assignments, status, lower bound). Status is "ok" (optimal), "infeasible"
+    or "node_limit", which returns the best schedule found so far, if any.
+    """
+    n, m = cost_matrix.shape
+    plans = week_plans(cap)
+    if not len(plans):
+        return None, "infeasible", np.inf
+    plan_cost = cost_matrix[:, plans].sum(axis=2)  # (groups x plans)
+    usage = np.zeros((len(plans), T * m))
+    usage[np.arange(len(plans))[:, None], np.arange(T) * m + plans] = 1
+    stations = cap.reshape(-1).astype(float)
+    electives = np.eye(m)[plans]  # (plans x weeks x electives)
+
+    allowed = np.ones(plan_cost.shape, dtype=bool)
+    root = solve_plan_lp(plan_cost, usage, allowed, stations)
+    if root is None:
+        return None, "infeasible", np.inf
+    heap = [(root[0], 0, allowed, root[1])]
+    pushed = 1
+    best, best_cost = None, np.inf
+    for _ in range(node_limit):
+        if not heap:
+            break
+        bound, _, allowed, x = heapq.heappop(heap)
+        if bound >= best_cost - 1e-9:
+            continue
+        share = np.einsum("ip,ptj->itj", x, electives)
+        if np.abs(share - np.round(share)).max() < 1e-6:
+            best, best_cost = x.argmax(axis=1), bound
+            continue
+        i, t, j = np.unravel_index(np.argmin(np.abs(share - 0.5)), share.shape)
+        has = plans[:, t] == j
+        for keep in (has, ~has):
+            child = allowed.copy()
+            child[i] &= keep
+            if not child[i].any():
+                continue
+            solved = solve_plan_lp(plan_cost, usage, child, stations)
+            if solved is not None and solved[0] < best_cost - 1e-9:
+                heapq.heappush(heap, (solved[0], pushed, child, solved[1]))
+                pushed += 1
+
+    heap = [node for node in heap if node[0] < best_cost - 1e-9]
+    status = "node_limit" if heap else "ok"
+    bound = min([best_cost] + [node[0] for node in heap])
+    if best is None:
+        return None, "node_limit" if heap else "infeasible", bound
+    return [(i, int(j), t + 1) for i, p in enumerate(best) for t, j in enumerate(plans[p])], status, bound
 
 
 # ---------------------------------------------------------------------------
 # ILP (optimal) and Greedy solvers
 # ---------------------------------------------------------------------------
-def solve_ilp(groups: List[str], costs: Dict[str, Dict[str, float]], T: int = 2):
+def solve_ilp(groups: List[str], costs: CostTable, T: int = 2, capacity: Any = None):
     """
     Integer Linear Program with variables x[g,t,e] in {0,1}:
       - Minimize sum_{g,t,e} x[g,t,e] * costs[g][e]
       Subject to:
-        (1) For each group g and week t in {1,2}: sum_e x[g,t,e] = 1
-        (2) For each group g and elective e:      sum_t x[g,t,e] <= 1  (no repeats)
-        (3) For each week t and elective e:       sum_g x[g,t,e] <= 1  (one station per week)
+        (1) For each group g and week t in 1..T: sum_e x[g,t,e] = 1
+        (2) For each group g and elective e:    sum_t x[g,t,e] <= 1  (no repeats)
+        (3) For each week t and elective e:     sum_g x[g,t,e] <= capacity[t][e]
+    Variables are only created for stations that exist (capacity > 0).
     """
     try:
         import pulp
     except ImportError:
         return None, "pulp_not_available"
 
-    prob = pulp.LpProblem("RankedPreferencesTwoElectiveScheduling", pulp.LpMinimize)
+    cap = capacity_matrix(capacity, T)
+    cost_matrix = as_cost_matrix(groups, costs)
+    weeks = range(1, T + 1)
+    open_slots = [(t, e) for t in weeks for j, e in enumerate(ELECTIVES) if cap[t - 1, j] > 0]
+    column = {e: j for j, e in enumerate(ELECTIVES)}
+
+    prob = pulp.LpProblem("RankedPreferencesElectiveScheduling", pulp.LpMinimize)
 
     x = pulp.LpVariable.dicts(
         "x",
-        ((g, t, e) for g in groups for t in range(1, T + 1) for e in ELECTIVES),
+        ((g, t, e) for g in groups for t, e in open_slots),
         lowBound=0, upBound=1, cat=pulp.LpBinary
     )
 
     # Objective
-    prob += pulp.lpSum(x[g, t, e] * costs[g][e] for g in groups for t in range(1, T + 1) for e in ELECTIVES)
+    prob += pulp.lpSum(x[g, t, e] * float(cost_matrix[i, column[e]]) for i, g in enumerate(groups) for t, e in open_slots)
 
     # (1) One elective per group per week
     for g in groups:
-        for t in range(1, T + 1):
-            prob += pulp.lpSum(x[g, t, e] for e in ELECTIVES) == 1
+        for t in weeks:
+            prob += pulp.lpSum(x[g, t, e] for tt, e in open_slots if tt == t) == 1
 
     # (2) No repeating an elective for the same group
     for g in groups:
         for e in ELECTIVES:
-            prob += pulp.lpSum(x[g, t, e] for t in range(1, T + 1)) <= 1
+            prob += pulp.lpSum(x[g, t, ee] for t, ee in open_slots if ee == e) <= 1
 
-    # (3) One station per elective per week
-    for t in range(1, T + 1):
-        for e in ELECTIVES:
-            prob += pulp.lpSum(x[g, t, e] for g in groups) <= 1
+    # (3) Stations per elective per week
+    for t, e in open_slots:
+        prob += pulp.lpSum(x[g, t, e] for g in groups) <= int(cap[t - 1, column[e]])
 
     status = prob.solve(pulp.PULP_CBC_CMD(msg=False))
     try:
@@ -269,214 +781,625 @@ def solve_ilp(groups: List[str], costs: Dict[str, Dict[str, float]], T: int = 2)
         return None, f"not_optimal:{status_str}"
 
     # Extract
-    schedule = {t: {e: None for e in ELECTIVES} for t in range(1, T + 1)}
-    by_group = {g: {} for g in groups}
-    total_cost = 0.0
-    group_cost = {g: 0.0 for g in groups}
+    assignments = [(i, column[e], t) for i, g in enumerate(groups) for t, e in open_slots if x[g, t, e].value() > 0.5]
+    return build_result(groups, cost_matrix, assignments, T), "ok"
 
-    for g in groups:
-        for t in range(1, T + 1):
-            for e in ELECTIVES:
-                if x[g, t, e].value() > 0.5:
-                    schedule[t][e] = g
-                    by_group[g][e] = t
-                    total_cost += costs[g][e]
-                    group_cost[g] += costs[g][e]
 
-    return {"schedule": schedule, "by_group": by_group, "total_cost": total_cost, "group_cost": group_cost}, "ok"
+def solve_greedy(groups: List[str], costs: CostTable, T: int = 2, capacity: Any = None, improve: bool = True):
+    """
+    Greedy fallback over the cost matrix:
+      For each week, pop (group, elective) pairs cheapest first from a heap, skipping
+      groups already placed this week, full electives and electives the group already
+      did. If a group is left without a station, an augmenting path moves placed groups
+      to other open electives to make room. With improve=True a local search then
+      re-plans one or two groups at a time while that lowers the total cost.
+    With the same stations every week nothing needs guessing: the schedule comes from
+    uniform_assignments and is optimal.
+    """
+    cap = capacity_matrix(capacity, T)
+    cost_matrix = as_cost_matrix(groups, costs)
+    if not (cap != cap[0]).any():
+        assignments = uniform_assignments(cost_matrix, T, cap[0])
+        if assignments is None:
+            return None, "infeasible"
+        return build_result(groups, cost_matrix, assignments, T), "ok"
+
+    n, m = cost_matrix.shape
+    # week_plan[i, t-1] = elective index of group i in week t, -1 while unassigned
+    week_plan = np.full((n, T), -1, dtype=int)
+
+    for w in range(T):
+        load = np.zeros(m, dtype=int)
+        taken = np.zeros((n, m), dtype=bool)
+        for earlier in range(w):
+            taken[np.arange(n), week_plan[:, earlier]] = True
+        open_pairs = np.argwhere(~taken & (cap[w] > 0))
+        heap = list(zip(cost_matrix[open_pairs[:, 0], open_pairs[:, 1]].tolist(), open_pairs[:, 0].tolist(), open_pairs[:, 1].tolist()))
+        heapq.heapify(heap)
+
+        placed = 0
+        while heap and placed < n:
+            _, i, j = heapq.heappop(heap)
+            if week_plan[i, w] >= 0 or load[j] >= cap[w, j]:
+                continue
+            week_plan[i, w] = j
+            load[j] += 1
+            placed += 1
+
+        for i in np.flatnonzero(week_plan[:, w] < 0):
+            if not _augment(int(i), w, week_plan, taken, load, cap[w]):
+                raise RuntimeError(f"Greedy failed to assign {T} electives for group {groups[i]}.")
+
+    if improve:
+        _improve_schedule(week_plan, cost_matrix, cap)
 
+    assignments = [(i, int(week_plan[i, w]), w + 1) for i in range(n) for w in range(T)]
+    return build_result(groups, cost_matrix, assignments, T), "ok_greedy"
 
-def solve_greedy(groups: List[str], costs: Dict[str, Dict[str, float]], T: int = 2):
+
+def _augment(start: int, w: int, week_plan: np.ndarray, taken: np.ndarray, load: np.ndarray, cap_week: np.ndarray) -> bool:
     """
-    Greedy fallback:
-      For each week, repeatedly assign the (group, elective) pair with minimal cost
-      among unassigned groups and unused electives, ensuring no group repeats an elective.
+    Place group `start` in week w by a breadth-first augmenting path: each step moves a
+    placed group to another elective it may take, ending at an elective with a free station.
     """
-    schedule = {t: {e: None for e in ELECTIVES} for t in range(1, T + 1)}
-    by_group = {g: {} for g in groups}
-    assigned = {g: set() for g in groups}
+    via = {}  # elective -> group that reached it
+    queue = deque([start])
+    seen_groups = {start}
+    while queue:
+        k = queue.popleft()
+        for j in np.flatnonzero(~taken[k] & (cap_week > 0)):
+            j = int(j)
+            if j in via or j == week_plan[k, w]:
+                continue
+            via[j] = k
+            if load[j] < cap_week[j]:
+                load[j] += 1
+                # Shift every group on the path one step along it
+                while True:
+                    k = via[j]
+                    previous = int(week_plan[k, w])
+                    week_plan[k, w] = j
+                    if previous < 0:
+                        break
+                    j = previous
+                return True
+            for other in np.flatnonzero(week_plan[:, w] == j):
+                if int(other) not in seen_groups:
+                    seen_groups.add(int(other))
+                    queue.append(int(other))
+    return False
+
+
+def _improve_schedule(week_plan: np.ndarray, cost_matrix: np.ndarray, cap: np.ndarray, max_moves: int = 10000) -> None:
+    """
+    Local search over whole plans, in place. A plan is a group's electives in week order.
+    Each step first tries to give one group the cheapest plan that fits the stations it
+    would free, then two groups at once, which covers swaps within a week, moves to a free
+    station and trades of electives across weeks. Stops when no step lowers the cost.
+    """
+    n, T = week_plan.shape
+    m = cap.shape[1]
+    weeks = np.arange(T)
+    plans = week_plans(cap)
+    plan_cost = cost_matrix[:, plans].sum(axis=2)  # (groups x plans)
+    cheapest = plan_cost.min(axis=1)
+    # need[p, q, t]: stations plans p and q take together in week t at plans[p, t]
+    need = 1 + (plans[:, None, :] == plans[None, :, :])
+
+    for _ in range(max_moves):
+        load = np.zeros((T, m), dtype=int)
+        np.add.at(load, (np.broadcast_to(weeks, week_plan.shape), week_plan), 1)
+        free = cap - load
+        current = cost_matrix[np.arange(n)[:, None], week_plan].sum(axis=1)
+
+        # One group: its own stations count as free
+        room = free[weeks, plans][None, :, :] + (week_plan[:, None, :] == plans[None, :, :])
+        gain = np.where((room >= 1).all(axis=2), current[:, None] - plan_cost, 0.0)
+        a, p = np.unravel_index(np.argmax(gain), gain.shape)
+        if gain[a, p] > 1e-12:
+            week_plan[a] = plans[p]
+            continue
 
-    for t in range(1, T + 1):
-        remaining_electives = set(ELECTIVES)
-        remaining_groups = set(groups)
-
-        while remaining_electives and remaining_groups:
-            best = None
-            best_val = float("inf")
-            for e in list(remaining_electives):
-                for g in list(remaining_groups):
-                    if e in assigned[g]:
-                        continue
-                    val = costs[g][e]
-                    if val < best_val:
-                        best_val = val
-                        best = (g, e)
-            if best is None:
+        # Two groups: the first pair that can do better together
+        moved = False
+        for a, b in itertools.combinations(range(n), 2):
+            if current[a] + current[b] - cheapest[a] - cheapest[b] <= 1e-12:
+                continue
+            stations = free.copy()
+            stations[weeks, week_plan[a]] += 1
+            stations[weeks, week_plan[b]] += 1
+            room = stations[weeks, plans]
+            fits = (room[:, None, :] >= need).all(axis=2) & (room[None, :, :] >= need).all(axis=2)
+            gain = np.where(fits, current[a] + current[b] - plan_cost[a][:, None] - plan_cost[b][None, :], 0.0)
+            p, q = np.unravel_index(np.argmax(gain), gain.shape)
+            if gain[p, q] > 1e-12:
+                week_plan[a], week_plan[b] = plans[p], plans[q]
+                moved = True
                 break
+        if not moved:
+            return
 
-            g, e = best
-            schedule[t][e] = g
-            by_group[g][e] = t
-            assigned[g].add(e)
-            remaining_electives.remove(e)
-            remaining_groups.remove(g)
 
-    # Sanity check: each group must have T electives assigned
-    print(assigned)
-    
-    for g in groups:
-        if len(assigned[g]) == T:
-            print(f"Assigned to group {g}")
-        else:
-            raise RuntimeError(f"Greedy failed to assign two electives for group {g}.")
+# ---------------------------------------------------------------------------
+# Seed / penalty sweep
+# ---------------------------------------------------------------------------
+def schedule_plan(result: Dict[str, Any], groups: List[str], T: int) -> np.ndarray:
+    """
+    (groups x weeks) array of elective indices, a compact key for comparing schedules.
+    """
+    column = {e: j for j, e in enumerate(ELECTIVES)}
+    plan = np.empty((len(groups), T), dtype=np.int8)
+    for i, g in enumerate(groups):
+        for e, t in result["by_group"][g].items():
+            plan[i, t - 1] = column[e]
+    return plan
 
-    total_cost = 0.0
-    group_cost = {}
-    for g in groups:
-        c = sum(costs[g][e] for e in assigned[g])
-        group_cost[g] = c
-        total_cost += c
 
-    return {"schedule": schedule, "by_group": by_group, "total_cost": total_cost, "group_cost": group_cost}, "ok_greedy"
+def sweep_batch(groups: List[str], ranks: np.ndarray, T: int, capacity: np.ndarray,
+                penalty: int, seeds: List[int], solver: str = "flow") -> List[Tuple[int, int, str, bytes | None]]:
+    """
+    Solve one penalty under several seeds; top level so a process pool can run batches.
+    Returns (seed, penalty, status, plan bytes or None) per seed.
+    """
+    solve = {"flow": solve_flow, "pulp": solve_ilp, "greedy": solve_greedy}[solver]
+    solved = []
+    for seed in seeds:
+        costs = build_cost_matrix(ranks, penalty, seed)
+        try:
+            result, status = solve(groups, costs, T=T, capacity=capacity)
+        except RuntimeError:
+            result, status = None, "greedy_failed"
+        plan = schedule_plan(result, groups, T).tobytes() if result is not None else None
+        solved.append((seed, penalty, status, plan))
+    return solved
+
+
+def sweep(groups: List[str],
+          ranks: np.ndarray,
+          T: int,
+          capacity: np.ndarray,
+          seeds: List[int],
+          penalties: List[int],
+          solver: str = "flow",
+          workers: int | None = None,
+          batch_size: int = 50) -> Tuple[pd.DataFrame, List[np.ndarray]]:
+    """
+    Solve the same rankings for every (penalty, seed) pair in a process pool and
+    deduplicate identical schedules.
+    Returns:
+      - solves: one row per solve (Seed, Penalty, Status, Schedule id, Total Cost, Worst Rank, Unlisted)
+        where Total Cost is without jitter, Worst Rank is the worst rank any group got
+        (unlisted counts as UNLISTED_RANK) and Unlisted counts unranked assignments
+      - plans: distinct (groups x weeks) elective index arrays, indexed by Schedule id
+    """
+    batches = [(penalty, seeds[k:k + batch_size]) for penalty in penalties for k in range(0, len(seeds), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(sweep_batch, groups, ranks, T, capacity, penalty, batch, solver) for penalty, batch in batches]
+        solved = [row for future in futures for row in future.result()]
+
+    n = len(groups)
+    effective = np.where(ranks > 0, ranks, UNLISTED_RANK)
+    ids: Dict[bytes, int] = {}
+    plans: List[np.ndarray] = []
+    rows = []
+    for seed, penalty, status, key in solved:
+        row = {"Seed": seed, "Penalty": penalty, "Status": status, "Schedule": None, "Total Cost": None, "Worst Rank": None, "Unlisted": None}
+        if key is not None:
+            if key not in ids:
+                ids[key] = len(plans)
+                plans.append(np.frombuffer(key, dtype=np.int8).reshape(n, T).astype(int))
+            plan = plans[ids[key]]
+            chosen = ranks[np.arange(n)[:, None], plan]
+            row.update({
+                "Schedule": ids[key],
+                "Total Cost": float(np.where(chosen > 0, chosen - 1, penalty).sum()),
+                "Worst Rank": int(effective[np.arange(n)[:, None], plan].max()),
+                "Unlisted": int((chosen == 0).sum()),
+            })
+        rows.append(row)
+    return pd.DataFrame(rows), plans
+
+
+def group_worst_ranks(plans: List[np.ndarray], ranks: np.ndarray) -> np.ndarray:
+    """
+    (schedules x groups) worst rank each group gets in each distinct schedule,
+    UNLISTED_RANK where the group got an elective it did not rank.
+    """
+    if not plans:
+        return np.zeros((0, ranks.shape[0]), dtype=int)
+    effective = np.where(ranks > 0, ranks, UNLISTED_RANK)
+    rows = np.arange(ranks.shape[0])[:, None]
+    return np.stack([effective[rows, plan].max(axis=1) for plan in plans])
+
+
+def rank_label(rank: int) -> str:
+    return "unlisted" if rank == UNLISTED_RANK else str(rank)
+
+
+def print_sweep_report(solves: pd.DataFrame, plans: List[np.ndarray], groups: List[str], ranks: np.ndarray, elapsed: float) -> None:
+    """
+    Cost and fairness distribution of a sweep: per penalty the spread of total cost and
+    worst rank, then the groups whose worst rank changes with the seed.
+    """
+    ok = solves.dropna(subset=["Schedule"])
+    print(f"Sweep: {len(solves)} solves in {elapsed:.2f} s, {len(ok)} feasible, {len(plans)} distinct schedule(s)")
+    for penalty, rows in ok.groupby("Penalty"):
+        cost = rows["Total Cost"]
+        worst_ranks = ", ".join(f"{rank_label(r)}: {c}" for r, c in rows["Worst Rank"].value_counts().sort_index().items())
+        print(f"  penalty {penalty}: {rows['Schedule'].nunique()} schedule(s), total cost min {cost.min():g} / mean {cost.mean():.2f} / max {cost.max():g}, "
+              f"worst rank {{{worst_ranks}}}, unlisted {rows['Unlisted'].value_counts().sort_index().to_dict()}")
+
+    worst = group_worst_ranks(plans, ranks)
+    if len(plans):
+        counts = np.bincount(worst.ravel(), minlength=UNLISTED_RANK + 1)[1:]
+        print("  group worst rank over distinct schedules: " + ", ".join(f"{rank_label(r)}: {c}" for r, c in enumerate(counts, start=1) if c))
+        # Only the seed should change between schedules compared here, so compare within each penalty
+        for penalty, rows in ok.groupby("Penalty"):
+            seen = worst[rows["Schedule"].unique().astype(int)]
+            varies = np.flatnonzero(seen.min(axis=0) != seen.max(axis=0))
+            if len(varies):
+                print(f"  penalty {penalty} seed-dependent groups: " + ", ".join(f"{groups[i]} ({rank_label(seen[:, i].min())}-{rank_label(seen[:, i].max())})" for i in varies))
+            else:
+                print(f"  penalty {penalty}: every group gets the same worst rank whatever the seed")
+
+
+def write_sweep_output(output_path: str, solves: pd.DataFrame, plans: List[np.ndarray], groups: List[str], ranks: np.ndarray) -> None:
+    """
+    Workbook with sheets:
+      - Solves: one row per (penalty, seed)
+      - Schedules: each distinct schedule, how often it came up and each group's electives by week
+      - WorstRank: worst rank per group in each distinct schedule (UNLISTED_RANK for an unranked elective)
+    """
+    counts = solves["Schedule"].value_counts()
+    schedule_rows = []
+    for k, plan in enumerate(plans):
+        row = {"Schedule": k, "Solves": int(counts.get(k, 0))}
+        for i, g in enumerate(groups):
+            row[g] = " / ".join(ELECTIVES[j] for j in plan[i])
+        schedule_rows.append(row)
+    df_worst = pd.DataFrame(group_worst_ranks(plans, ranks), columns=groups)
+    df_worst.insert(0, "Schedule", range(len(plans)))
+
+    with pd.ExcelWriter(output_path, engine="xlsxwriter") as writer:
+        solves.to_excel(writer, sheet_name="Solves", index=False)
+        pd.DataFrame(schedule_rows, columns=["Schedule", "Solves", *groups]).to_excel(writer, sheet_name="Schedules", index=False)
+        df_worst.to_excel(writer, sheet_name="WorstRank", index=False)
 
 
 # ---------------------------------------------------------------------------
 # Output writer
 # ---------------------------------------------------------------------------
-def write_output(output_path: str,
-                 result: Dict[str, Any],
-                 groups: List[str],
-                 costs: Dict[str, Dict[str, float]],
-                 ranks: Dict[str, Dict[str, int | None]],
-                 seed: int | None,
-                 unlisted_penalty: int,
-                 T: int = 2) -> None:
+def output_tables(result: Dict[str, Any],
+                  groups: List[str],
+                  costs: CostTable,
+                  ranks: RankTable,
+                  unlisted_penalty: int,
+                  T: int = 2,
+                  capacity: Any = None) -> Dict[str, Tuple[List[str], List[List[Any]]]]:
     """
-    Create the Excel workbook with sheets:
-      - Schedule (Week 1 Heat Transfer + Weeks 2/3 electives)
+    Build the output tables as (header, rows) of plain values, keyed by sheet name:
+      - Schedule (Week 1 Heat Transfer + electives in Weeks 2..T+1)
       - ByGroup
       - Summary
       - Costs
       - Roster
       - Week1_HeatTransfer
       - Capacities
-      - Notes
+    None marks an empty cell.
     """
     # Helper for readability in Excel
     def tidy(x):
-        return "" if x is None else x
+        return None if not x else "\n".join(x)
+
+    cap = capacity_matrix(capacity, T)
+    cost_matrix = as_cost_matrix(groups, costs)
+    rank_matrix = as_rank_matrix(groups, ranks)
+    column = {e: j for j, e in enumerate(ELECTIVES)}
 
     # 1) Schedule sheet with Week 1 visible and Heat Transfer column
-    rows = []
     # Week 1 row: list all groups in Heat Transfer cell (wrapped)
-    ht_list = "\n".join(groups)
-    row_w1 = {"Week": 1, "Heat Transfer": ht_list}
-    for e in ELECTIVES:
-        row_w1[e] = ""
-    rows.append(row_w1)
-
-    # Weeks 2 & 3 rows
+    schedule = [[1, "\n".join(groups), *([None] * len(ELECTIVES))]]
+    # Elective week rows
     for t in range(1, T + 1):
-        row = {"Week": t + 1, "Heat Transfer": ""}
-        for e in ELECTIVES:
-            row[e] = tidy(result["schedule"][t][e])
-        rows.append(row)
-    df_sched = pd.DataFrame(rows, columns=["Week", "Heat Transfer", *ELECTIVES])
-
-    # 2) ByGroup sheet
-    rows_g = []
-    for g in groups:
-        row = {"Group": g, "Cost": round(result["group_cost"].get(g, float("nan")), 4)}
-        for e in ELECTIVES:
+        schedule.append([t + 1, None, *(tidy(result["schedule"][t][e]) for e in ELECTIVES)])
+
+    # 2) ByGroup sheet, columns for every elective some group does
+    used = [e for e in ELECTIVES if any(result["schedule"][t][e] for t in range(1, T + 1))]
+    by_group_header = ["Group", "Cost"] + [f"{e} ({part})" for e in used for part in ("week", "rank", "cost")]
+    by_group = []
+    for i, g in enumerate(groups):
+        row = [g, round(result["group_cost"].get(g, float("nan")), 4)]
+        for e in used:
             if e in result["by_group"][g]:
-                # convert solver week index 1/2 -> calendar weeks 2/3
-                row[f"{e} (week)"] = result["by_group"][g][e] + 1
-                r = ranks[g][e]
-                row[f"{e} (rank)"] = r if r is not None else f"unlisted({unlisted_penalty})"
-                row[f"{e} (cost)"] = round(costs[g][e], 4)
-        rows_g.append(row)
-    df_bygroup = pd.DataFrame(rows_g)
-
-    # 3) Summary
-    df_summary = pd.DataFrame([{"Total Cost": round(result["total_cost"], 4)}])
-
-    # 4) Cost matrix
-    df_costs = pd.DataFrame.from_dict(costs, orient="index")[ELECTIVES].reset_index().rename(columns={"index": "Group"})
-
-    # 5) Roster and Week 1 explicit listing
-    df_roster = pd.DataFrame({"Group": groups})
-    df_week1 = pd.DataFrame({"Group": groups, "Week": [1] * len(groups), "Experiment": ["Heat Transfer"] * len(groups)})
-
-    # 6) Capacities (per-week capacity, assigned, remaining)
-    cap_rows = []
+                # convert solver week index 1..T -> calendar weeks 2..T+1
+                r = int(rank_matrix[i, column[e]])
+                row += [result["by_group"][g][e] + 1, r if r else f"unlisted({unlisted_penalty})", round(float(cost_matrix[i, column[e]]), 4)]
+            else:
+                row += [None, None, None]
+        by_group.append(row)
+
+    # 3) Capacities (per-week capacity, assigned, remaining)
     # Week 1
-    cap_rows.append({"Week": 1, "Experiment": "Heat Transfer", "Capacity": len(groups), "Assigned": len(groups), "Remaining": 0})
-    for e in ELECTIVES:
-        cap_rows.append({"Week": 1, "Experiment": e, "Capacity": 0, "Assigned": 0, "Remaining": 0})
-    # Weeks 2 & 3 (one station per elective per week)
+    capacities = [[1, "Heat Transfer", len(groups), len(groups), 0]]
+    capacities += [[1, e, 0, 0, 0] for e in ELECTIVES]
+    # Elective weeks (stations per elective per week)
     for t in range(1, T + 1):
         week = t + 1
-        for e in ELECTIVES:
-            assigned = 1 if (result["schedule"][t][e] is not None and result["schedule"][t][e] != "") else 0
-            cap_rows.append({"Week": week, "Experiment": e, "Capacity": 1, "Assigned": assigned, "Remaining": 1 - assigned})
-        cap_rows.append({"Week": week, "Experiment": "Heat Transfer", "Capacity": 0, "Assigned": 0, "Remaining": 0})
-    df_caps = pd.DataFrame(cap_rows, columns=["Week", "Experiment", "Capacity", "Assigned", "Remaining"])
+        for j, e in enumerate(ELECTIVES):
+            stations = int(cap[t - 1, j])
+            assigned = len(result["schedule"][t][e])
+            capacities.append([week, e, stations, assigned, stations - assigned])
+        capacities.append([week, "Heat Transfer", 0, 0, 0])
+
+    return {
+        "Schedule": (["Week", "Heat Transfer", *ELECTIVES], schedule),
+        "ByGroup": (by_group_header, by_group),
+        "Summary": (["Total Cost"], [[round(result["total_cost"], 4)]]),
+        "Costs": (["Group", *ELECTIVES], [[g, *row] for g, row in zip(groups, cost_matrix.tolist())]),
+        "Roster": (["Group"], [[g] for g in groups]),
+        "Week1_HeatTransfer": (["Group", "Week", "Experiment"], [[g, 1, "Heat Transfer"] for g in groups]),
+        "Capacities": (["Week", "Experiment", "Capacity", "Assigned", "Remaining"], capacities),
+    }
+
+
+def notes_lines(seed: int | None, unlisted_penalty: int, T: int = 2) -> List[str]:
+    return [
+        "Notes:",
+        "- All groups perform Heat Transfer in Week 1 (see Schedule and Week1_HeatTransfer).",
+        f"- Weeks 2 to {T + 1} schedule {T} electives per group, never repeating an elective.",
+        "- Capacity: per week, at most as many groups per elective as it has stations (see Capacities).",
+        f"- UNLISTED_PENALTY = {unlisted_penalty} (used if a group did not rank an elective; higher = avoid unlisted more strongly).",
+        f"- Seed = {seed if seed is not None else '(none)'} (controls tie-break reproducibility).",
+    ]
+
+
+def write_sheet(workbook, name: str, header: List[str], rows: List[List[Any]], header_format=None,
+                columns: List[Tuple[int, int, int, Any]] = ()) -> None:
+    """
+    Stream one table into a new worksheet, row by row (works in constant_memory mode).
+    columns: (first, last, width, format) set before any row is written.
+    """
+    ws = workbook.add_worksheet(name)
+    for first, last, width, column_format in columns:
+        ws.set_column(first, last, width, column_format)
+    ws.write_row(0, 0, header, header_format)
+    for r, row in enumerate(rows, start=1):
+        for c, value in enumerate(row):
+            if value is not None:
+                ws.write(r, c, value)
 
-    # Write workbook
-    with pd.ExcelWriter(output_path, engine="xlsxwriter") as writer:
-        # Schedule
-        df_sched.to_excel(writer, sheet_name="Schedule", index=False)
-        ws = writer.sheets["Schedule"]
-        wrap = writer.book.add_format({"text_wrap": True})
-        ws.set_column(1, 1, 40, wrap)  # Heat Transfer column wide & wrapped
-
-        # Other sheets
-        df_bygroup.to_excel(writer, sheet_name="ByGroup", index=False)
-        df_summary.to_excel(writer, sheet_name="Summary", index=False)
-        df_costs.to_excel(writer, sheet_name="Costs", index=False)
-        df_roster.to_excel(writer, sheet_name="Roster", index=False)
-        df_week1.to_excel(writer, sheet_name="Week1_HeatTransfer", index=False)
-        df_caps.to_excel(writer, sheet_name="Capacities", index=False)
-
-        # Notes
-        notes = writer.book.add_worksheet("Notes")
-        notes.write(0, 0, "Notes:")
-        notes.write(1, 0, "- All groups perform Heat Transfer in Week 1 (see Schedule and Week1_HeatTransfer).")
-        notes.write(2, 0, "- Weeks 2 & 3 schedule the two electives with one station per elective per week.")
-        notes.write(3, 0, "- Capacity: per week, at most 1 group per elective; with two elective weeks total, an elective can host up to 2 groups (one in Week 2 and one in Week 3).")
-        notes.write(4, 0, f"- UNLISTED_PENALTY = {unlisted_penalty} (used if a group did not rank an elective; higher = avoid unlisted more strongly).")
-        notes.write(5, 0, f"- Seed = {seed if seed is not None else '(none)'} (controls tie-break reproducibility).")
+
+def write_tables_xlsx(workbook, tables: Dict[str, Tuple[List[str], List[List[Any]]]], prefix: str = "") -> None:
+    """
+    Write output_tables() to an open xlsxwriter workbook, sheet names prefixed with `prefix`.
+    """
+    bold = workbook.add_format({"bold": True})
+    wrap = workbook.add_format({"text_wrap": True})
+    schedule_columns = [
+        (1, 1, 40, wrap),  # Heat Transfer column wide & wrapped
+        (2, 1 + len(ELECTIVES), 20, wrap),  # several groups can share an elective
+    ]
+    for name, (header, rows) in tables.items():
+        write_sheet(workbook, f"{prefix}{name}", header, rows, bold, schedule_columns if name == "Schedule" else ())
+
+
+def write_notes(workbook, seed: int | None, unlisted_penalty: int, T: int = 2) -> None:
+    notes = workbook.add_worksheet("Notes")
+    for r, line in enumerate(notes_lines(seed, unlisted_penalty, T)):
+        notes.write(r, 0, line)
+
+
+def output_format(output_path: str, fmt: str | None = None) -> str:
+    """
+    The format to write: fmt if given, else the extension of output_path (xlsx if it has none).
+    Only the file name's suffix counts, so dotted directories are fine.
+    """
+    fmt = (fmt or Path(output_path).suffix.lstrip(".") or "xlsx").lower()
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f'Unknown output format "{fmt}", expected {", ".join(OUTPUT_FORMATS)}.')
+    return fmt
+
+
+def write_output(output_path: str,
+                 result: Dict[str, Any],
+                 groups: List[str],
+                 costs: CostTable,
+                 ranks: RankTable,
+                 seed: int | None,
+                 unlisted_penalty: int,
+                 T: int = 2,
+                 capacity: Any = None,
+                 fmt: str | None = None) -> None:
+    """
+    Write the schedule in one of three formats (default: from the file extension):
+      - xlsx: the output_tables() sheets plus Notes, streamed with xlsxwriter in constant_memory mode
+      - json: {"total_cost", "weeks", "seed", "unlisted_penalty", "tables": {sheet: [row dicts]}}
+      - csv:  one file per table, <output stem>_<sheet>.csv
+    """
+    fmt = output_format(output_path, fmt)
+    tables = output_tables(result, groups, costs, ranks, unlisted_penalty, T, capacity)
+    if fmt == "xlsx":
+        import xlsxwriter
+        workbook = xlsxwriter.Workbook(output_path, {"constant_memory": True})
+        write_tables_xlsx(workbook, tables)
+        write_notes(workbook, seed, unlisted_penalty, T)
+        workbook.close()
+    elif fmt == "json":
+        document = {
+            "total_cost": result["total_cost"], "weeks": T, "seed": seed, "unlisted_penalty": unlisted_penalty,
+            "tables": {name: [dict(zip(header, row)) for row in rows] for name, (header, rows) in tables.items()},
+        }
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=1)
+    else:
+        stem = Path(output_path).with_suffix("")
+        for name, (header, rows) in tables.items():
+            with open(f"{stem}_{name}.csv", "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+
+
+def write_combined_output(output_path: str, sections: Dict[str, Dict[str, Any]], seed: int | None, unlisted_penalty: int, T: int = 2) -> None:
+    """
+    One workbook for several sections: an Overview sheet, then each section's sheets
+    prefixed with its name (e.g. "S01 Schedule"), then Notes.
+    `sections` maps section name -> solve_section() output. A section without a schedule
+    is listed on Overview with its status and no total cost, and gets no sheets.
+    """
+    import xlsxwriter
+    workbook = xlsxwriter.Workbook(output_path, {"constant_memory": True})
+    overview = [[name, len(s["groups"]), s["status"], round(s["result"]["total_cost"], 4) if s["result"] is not None else None]
+                for name, s in sections.items()]
+    write_sheet(workbook, "Overview", ["Section", "Groups", "Status", "Total Cost"], overview, workbook.add_format({"bold": True}))
+    for name, s in sections.items():
+        if s["result"] is None:
+            continue
+        tables = output_tables(s["result"], s["groups"], s["costs"], s["ranks"], unlisted_penalty, T, s["capacity"])
+        write_tables_xlsx(workbook, tables, prefix=f"{name} ")
+    write_notes(workbook, seed, unlisted_penalty, T)
+    workbook.close()
+
+
+def solve_section(input_data: List[Dict[str, Any]],
+                  electives: List[str],
+                  stations: int | None,
+                  T: int = 2,
+                  unlisted_penalty: int = 5,
+                  seed: int | None = None,
+                  output_path: str | None = None) -> Dict[str, Any]:
+    """
+    Build costs, solve and (optionally) write one section's workbook. Top level so a
+    process pool can run sections side by side. stations=None gives every elective just
+    enough stations to seat the section. Returns groups, costs, ranks, capacity, result,
+    status and solve/write times in seconds; result is None when infeasible.
+    """
+    started = time.perf_counter()
+    groups, costs, ranks = process_input_arrays(input_data, electives, unlisted_penalty, seed)
+    stations = stations or -(-len(groups) // len(ELECTIVES))
+    capacity = capacity_matrix(stations, T)
+    result, status = solve_flow(groups, costs, T=T, capacity=capacity)
+    solved = time.perf_counter()
+    if result is not None and output_path:
+        write_output(output_path, result, groups, costs, ranks, seed, unlisted_penalty, T=T, capacity=capacity)
+    return {
+        "groups": groups, "costs": costs, "ranks": ranks, "stations": stations, "capacity": capacity,
+        "result": result, "status": status,
+        "solve_time": solved - started, "write_time": time.perf_counter() - solved,
+    }
 
 
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
+def parse_capacity(values: List[str] | None, T: int) -> Any:
+    """
+    Parse --capacity values into a capacity spec for capacity_matrix:
+      - "2"                 -> every elective has 2 stations every week
+      - "Acoustics=2"       -> Acoustics has 2 stations every week
+      - "Acoustics=1:2"     -> Acoustics has 1 station in the first elective week, 2 in the second
+    A bare number sets the default for electives not named afterwards.
+    """
+    if not values:
+        return None
+    default = 1
+    capacity: Dict[str, Any] = {}
+    for value in values:
+        if "=" not in value:
+            default = int(value)
+            continue
+        elective, stations = value.split("=", 1)
+        if elective not in ELECTIVES:
+            raise SystemExit(f'Unknown elective "{elective}" in --capacity. Expected one of: {ELECTIVES}')
+        weekly = [int(c) for c in stations.split(":")]
+        if len(weekly) not in (1, T):
+            raise SystemExit(f'--capacity {value} lists {len(weekly)} weeks, expected 1 or {T}.')
+        capacity[elective] = weekly[0] if len(weekly) == 1 else weekly
+    return {e: capacity.get(e, default) for e in ELECTIVES}
+
+
 def main():
-    parser = argparse.ArgumentParser(description="Ranked-preference two-elective scheduler (Heat Transfer fixed to Week 1).")
+    parser = argparse.ArgumentParser(description="Ranked-preference elective scheduler (Heat Transfer fixed to Week 1).")
     parser.add_argument("--input", required=True, help="Path to input Excel file")
-    parser.add_argument("--output", required=True, help="Path to output Excel file")
+    parser.add_argument("--output", default=None, help="Path to output file, .xlsx/.json/.csv (with --sweep: the sweep workbook, optional)")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default=None, help="Output format (default: from the --output extension, else xlsx)")
     parser.add_argument("--sheet", default="Input", help="Sheet name containing the table (default: Input)")
-    parser.add_argument("--solver", choices=["pulp", "greedy"], default="pulp", help="Use PuLP+CBC if available, else greedy")
+    parser.add_argument("--solver", choices=["flow", "pulp", "greedy"], default="flow", help="Built-in exact solver (default), PuLP+CBC if available, or greedy")
+    parser.add_argument("--no-local-search", action="store_true", help="Greedy: skip the local search that re-plans one or two groups at a time")
+    parser.add_argument("--check", action="store_true", help="Cross-check the schedule's total cost against PuLP+CBC (if installed)")
+    parser.add_argument("--weeks", type=int, default=2, help="Number of elective weeks after Heat Transfer (default: 2)")
+    parser.add_argument("--capacity", nargs="+", default=None, help="Stations per elective: N for all, Elective=N, or Elective=N1:N2 per week (default: 1)")
     parser.add_argument("--unlisted-penalty", type=int, default=5, help="Penalty if an elective was not ranked (default: 5)")
     parser.add_argument("--seed", type=int, default=None, help="Random seed for tie-break jitter (default: None)")
+    parser.add_argument("--sweep", type=int, default=None, help="Solve under this many seeds (from --seed, default 0) and report the spread instead of writing one schedule")
+    parser.add_argument("--sweep-penalties", type=int, nargs="+", default=None, help="With --sweep: unlisted penalties to try (default: --unlisted-penalty)")
+    parser.add_argument("--workers", type=int, default=None, help="With --sweep: worker processes (default: one per CPU)")
     args = parser.parse_args()
-
-    groups, costs, ranks = read_input_and_build_costs(args.input, args.sheet, args.unlisted_penalty, args.seed)
-
-    if len(groups) > 5:
-        raise SystemExit(f"Infeasible: {len(groups)} groups but only 5 one-station electives per week. Split the section or add capacity.")
-
-    if args.solver == "pulp":
-        result, status = solve_ilp(groups, costs, T=2)
+    if args.sweep is None and args.output is None:
+        parser.error("--output is required unless --sweep is given")
+    if args.sweep is not None and args.sweep < 1:
+        parser.error("--sweep must be at least 1")
+    if args.sweep is not None and args.solver == "pulp" and importlib.util.find_spec("pulp") is None:
+        # Every solve would come back pulp_not_available and read as infeasible
+        parser.error("--solver pulp needs PuLP installed (pip install pulp), or sweep with --solver flow")
+    if args.sweep is None:
+        # An unwritable format should fail before the solve, not after it
+        try:
+            output_format(args.output, args.format)
+        except ValueError as error:
+            parser.error(f"{error} Use --format or a .xlsx/.json/.csv --output.")
+
+    T = args.weeks
+    if not 1 <= T <= len(ELECTIVES):
+        raise SystemExit(f"--weeks must be between 1 and {len(ELECTIVES)} (a group never repeats an elective).")
+    capacity = capacity_matrix(parse_capacity(args.capacity, T), T)
+
+    groups, costs, ranks = read_input_arrays(args.input, args.sheet, args.unlisted_penalty, args.seed)
+
+    short = [t + 2 for t in range(T) if capacity[t].sum() < len(groups)]
+    if short:
+        raise SystemExit(f"Infeasible: {len(groups)} groups but only {capacity.sum(axis=1).min()} stations in week(s) {short}. Split the section or add capacity.")
+
+    if args.sweep is not None:
+        first = args.seed or 0
+        started = time.perf_counter()
+        solves, plans = sweep(groups, ranks, T, capacity, list(range(first, first + args.sweep)),
+                              args.sweep_penalties or [args.unlisted_penalty], args.solver, args.workers)
+        print_sweep_report(solves, plans, groups, ranks, time.perf_counter() - started)
+        if args.output:
+            write_sweep_output(args.output, solves, plans, groups, ranks)
+        return
+
+    if args.solver == "flow":
+        result, status = solve_flow(groups, costs, T=T, capacity=capacity)
+    elif args.solver == "pulp":
+        result, status = solve_ilp(groups, costs, T=T, capacity=capacity)
         if status != "ok":
-            print(f"Falling back to greedy due to ILP status: {status}", file=sys.stderr)
-            result, status = solve_greedy(groups, costs, T=2)
+            print(f"Falling back to the built-in solver due to ILP status: {status}", file=sys.stderr)
+            result, status = solve_flow(groups, costs, T=T, capacity=capacity)
     else:
-        result, status = solve_greedy(groups, costs, T=2)
+        try:
+            result, status = solve_greedy(groups, costs, T=T, capacity=capacity, improve=not args.no_local_search)
+        except RuntimeError:
+            result, status = None, "greedy_failed"
+
+    if result is None and status in ("greedy_failed", "node_limit"):
+        raise SystemExit(f"No schedule found ({status}): the {args.solver} solver gave up, which does not mean none exists. "
+                         "Install PuLP and use --solver pulp for an exact answer.")
+    if result is None:
+        raise SystemExit(f"No schedule found ({status}): no assignment gives every group {T} different electives within the station limits.")
+
+    if args.check:
+        reference, ref_status = solve_ilp(groups, costs, T=T, capacity=capacity)
+        if ref_status != "ok":
+            print(f"Cross-check skipped: ILP status {ref_status}", file=sys.stderr)
+        elif abs(reference["total_cost"] - result["total_cost"]) > 1e-9:
+            print(f"Cross-check FAILED: {args.solver} cost {result['total_cost']:.6f} vs ILP {reference['total_cost']:.6f}", file=sys.stderr)
+        else:
+            print(f"Cross-check ok: ILP total cost {reference['total_cost']:.6f}", file=sys.stderr)
 
-    write_output(args.output, result, groups, costs, ranks, args.seed, args.unlisted_penalty, T=2)
+    write_output(args.output, result, groups, costs, ranks, args.seed, args.unlisted_penalty, T=T, capacity=capacity, fmt=args.format)
     print(json.dumps({"status": status, "total_cost": result["total_cost"], "groups": len(groups)}))
 
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,190 @@
+import gzip
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+
+import firebase_admin
+from firebase_admin import credentials, db
+import streamlit as st
+
+
+CACHE_DIR = Path(".cache") / "firebase"
+
+#seconds a cached node is trusted before it is fetched again
+DEFAULT_TTL = 600
+
+#concurrent child downloads for paginated reads of large nodes
+DEFAULT_WORKERS = 8
+
+
+#DATA ACCESS LAYER FOR FIREBASE SURVEY NODES WITH A COMPRESSED ON-DISK CACHE
+class SurveyStore:
+    # Every Grader read goes through here, cache files are keyed by database path
+    def __init__(self, ttl: float = DEFAULT_TTL, offline: bool = False, cache_dir: str | Path = CACHE_DIR):
+        self.ttl = ttl
+        #offline never touches Firebase and ignores the ttl, useful with a local fixture
+        self.offline = offline
+        self.cache_dir = Path(cache_dir)
+
+        #whole nodes read by prefetch, served from memory for the rest of the run
+        self.memory = {}
+
+        self.hits = 0
+        self.misses = 0
+        #children are fetched from worker threads during paginated reads
+        self.lock = threading.Lock()
+
+    def connect(self):
+        #database authentication happens on the first live read so offline runs need no secrets
+        with self.lock:
+            if not firebase_admin._apps:
+                cred = dict(st.secrets["firebase_creds"])
+                cred = credentials.Certificate(cred)
+                firebase_admin.initialize_app(cred, {"databaseURL": st.secrets['database_url']['url']})
+
+    def count(self, hit: bool):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def cache_path(self, path: str, shallow: bool = False) -> Path:
+        name = quote(path.strip('/') or '_root', safe='')
+        return self.cache_dir / f"{name}{'.shallow' if shallow else ''}.json.gz"
+
+    def read_cache(self, path: str, shallow: bool = False):
+        #returns (found, data) for a fresh cache entry of exactly this path
+        if not shallow and path.strip('/') in self.memory:
+            return True, self.memory[path.strip('/')]
+        cache_file = self.cache_path(path, shallow)
+        if not cache_file.exists():
+            return False, None
+        if not self.offline and time.time() - cache_file.stat().st_mtime > self.ttl:
+            return False, None
+        with gzip.open(cache_file, "rt", encoding="utf-8") as f:
+            return True, json.load(f)
+
+    def put(self, path: str, data, shallow: bool = False):
+        #store a node in the cache, also used to seed a fixture for offline runs
+        cache_file = self.cache_path(path, shallow)
+        os.makedirs(cache_file.parent, exist_ok=True)
+        tmp = cache_file.with_suffix(".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, cache_file)
+
+    def lookup(self, path: str):
+        #a cached ancestor also answers for its children, e.g. Proposal_Responses for Proposal_Responses/<reviewer>
+        parts = [part for part in path.split('/') if part]
+        for depth in range(len(parts), -1, -1):
+            found, data = self.read_cache('/'.join(parts[:depth]))
+            if found:
+                for part in parts[depth:]:
+                    data = data.get(part) if isinstance(data, dict) else None
+                return True, data
+        return False, None
+
+    def get(self, path: str, shallow: bool = False):
+        found, data = self.lookup(path)
+        if found:
+            self.count(True)
+            if shallow and isinstance(data, dict):
+                return {key: True for key in data}
+            return data
+
+        if shallow:
+            found, data = self.read_cache(path, shallow=True)
+            if found:
+                self.count(True)
+                return data
+
+        if self.offline:
+            raise RuntimeError(f'{path} is not in the cache at {self.cache_dir}. Run once online or drop --offline.')
+
+        self.count(False)
+        self.connect()
+        data = db.reference(path).get(shallow=shallow)
+        self.put(path, data, shallow=shallow)
+        return data
+
+    def prefetch(self, paths: list[str], workers: int = DEFAULT_WORKERS):
+        #read several nodes concurrently in one pass, later reads of them or their children never leave memory
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, data in zip(paths, pool.map(self.get, paths)):
+                self.memory[path.strip('/')] = data
+
+    def get_after(self, path: str, key: str) -> dict:
+        #children of path with a key strictly after key, answered from the cache when possible
+        found, data = self.lookup(path)
+        if found:
+            self.count(True)
+            return {k: v for k, v in (data or {}).items() if k > key}
+
+        if self.offline:
+            raise RuntimeError(f'{path} is not in the cache at {self.cache_dir}. Run once online or drop --offline.')
+
+        #cursor queries are not cached, the next full read of the node refreshes it
+        self.count(False)
+        self.connect()
+        data = db.reference(path).order_by_key().start_at(key).get() or {}
+        return {k: v for k, v in data.items() if k != key}
+
+    def iter_children(self, path: str, after: dict[str, str] | None = None, workers: int = DEFAULT_WORKERS):
+        #yield (key, child) in key order from a shallow key listing plus one read per child
+        #after maps child key -> last grandchild key already seen, only newer grandchildren are returned
+        #at most `workers` children are downloading or waiting to be consumed at any time
+        after = after or {}
+        found, data = self.lookup(path)
+        if found:
+            #the whole node is already on disk, no need to split it up
+            self.count(True)
+            for key in sorted(data or {}):
+                child = data[key]
+                if key in after and isinstance(child, dict):
+                    child = {k: v for k, v in child.items() if k > after[key]}
+                yield key, child
+            return
+
+        def fetch(key):
+            if key in after:
+                return self.get_after(f'{path}/{key}', after[key])
+            return self.get(f'{path}/{key}')
+
+        keys = sorted(self.get(path, shallow=True) or {})
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for key in keys:
+                pending.append((key, pool.submit(fetch, key)))
+                if len(pending) >= workers:
+                    key, future = pending.popleft()
+                    yield key, future.result()
+            while pending:
+                key, future = pending.popleft()
+                yield key, future.result()
+
+    def iter_chunks(self, path: str, chunk_size: int | None = None, after: dict[str, str] | None = None, workers: int = DEFAULT_WORKERS):
+        #yield {child_key: child} dicts of up to chunk_size children, None reads the node in one request
+        if chunk_size is None and not after:
+            yield self.get(path) or {}
+            return
+
+        chunk = {}
+        for key, data in self.iter_children(path, after=after, workers=workers):
+            if data:
+                chunk[key] = data
+            if chunk_size and len(chunk) >= chunk_size:
+                yield chunk
+                chunk = {}
+        if chunk:
+            yield chunk
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return f'firebase cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)'
@@ -1,39 +1,60 @@
 from grader import Grader
 from canvas_tools import CanvasTool
+from roster import print_match_report, MATCH_CUTOFF
+import argparse
 import time
 
+parser = argparse.ArgumentParser(description="Grade a survey and upload the scores to Canvas")
+parser.add_argument("--refresh-roster", action="store_true", help="Reload the Canvas roster instead of using .cache/roster.json")
+parser.add_argument("--force", action="store_true", help="Re-post every grade and comment, even ones already in Canvas")
+parser.add_argument("--match-cutoff", type=float, default=MATCH_CUTOFF, help="Lowest similarity accepted when a survey name differs from the Canvas name")
+parser.add_argument("--match-report", default=None, help="Write every survey name to Canvas student join to this csv for review")
+parser.add_argument("--accept-fuzzy", action="store_true", help="Also upload grades for fuzzy name matches, check them in the match report first")
+args = parser.parse_args()
+
 grad = Grader()
 #grad.organize_responses()
 
 
 #proposal grades in form {student:[grade,text feedback]}
 gradebook = grad.grade_prop()
+print(grad.store.stats())
 
 
 #gradebook = grad.grade_symposium()
 
 mycanvas = CanvasTool()
-mycanvas.find_student_data()
+mycanvas.find_student_data(refresh=args.refresh_roster)
 
-#student data in form {student:[id,section,group]}
-course_list = mycanvas.student_data
+#Roster indexed by canvas id, login, name, section and group
+roster = mycanvas.roster
 
 #grade submissions in form {student_id:(grade,comments)}
 grades = {}
 
-for student in gradebook.keys():
-	if str(student) in course_list.keys():
-		id,section,grou,username = course_list[student]
-		score,comment = gradebook[student]
-		grades[id] = (score,comment)
+#survey display names are joined to Canvas names exactly, then normalized, then by fuzzy match
+matches = roster.match([str(student) for student in gradebook.keys()], cutoff=args.match_cutoff)
+print_match_report(matches, args.match_report)
+
+#fuzzy matches can pick the wrong student, they are only uploaded when asked for
+held_back = 0
+for match, (score,comment) in zip(matches, gradebook.values()):
+	if match.student is None:
+		print(f'could not find {match.name} in course')
+	elif match.method == 'fuzzy' and not args.accept_fuzzy:
+		held_back += 1
 	else:
-		print(f'could not find {student} in course')
+		grades[match.student.id] = (score,comment)
+
+if held_back:
+	print(f'{held_back} fuzzy matches were not uploaded, check them above and rerun with --accept-fuzzy')
 
 assignment_id = 3499459
 start = time.time()
 
-mycanvas.upload_bulk_grades(assignment_id,grades)
+mycanvas.upload_bulk_grades(assignment_id,grades,force=args.force)
 
 # for id in grades.keys():
 # 	print(grades[id])
-print(f'grade upload took {time.time()-start} seconds')
\ No newline at end of file
+print(f'grade upload took {time.time()-start} seconds')
+mycanvas.print_http_report('upload_grades')